@@ -1,14 +1,22 @@
 import os
 import time
+import re
 import json
 import logging
-from logging.handlers import RotatingFileHandler
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import pandas as pd
 import streamlit as st
 import mysql.connector
-from mysql.connector import pooling
+from mysql.connector.errors import InterfaceError, OperationalError
 from dotenv import load_dotenv
+from db_pool import ConnectionPool, prepared_queries
+from shared import (
+    LogIndexes, LookupCache, MetricsRegistry, QueryShapes, RecordCache, SlowQueryLog,
+    emit_event, id_prefix_ranges, log_files, log_gauges, parse_sample, parse_year,
+    parse_year_month, search_logs, start_log_writer, tail_logs,
+)
 
 # Env
 load_dotenv()
@@ -19,6 +27,23 @@ DB_USER = os.getenv("DB_USER", "root")
 DB_PASS = os.getenv("DB_PASS", "password")
 DB_NAME = os.getenv("DB_NAME", "sfils_db")
 
+# Connection pool: grows from DB_POOL_MIN to DB_POOL_MAX connections, callers
+# wait up to DB_POOL_WAIT seconds for a free one, connections idle longer than
+# DB_POOL_PING seconds are pinged before reuse and extra idle ones are closed
+# after DB_POOL_IDLE seconds
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "2"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_WAIT = float(os.getenv("DB_POOL_WAIT", "5"))
+DB_POOL_PING = float(os.getenv("DB_POOL_PING", "30"))
+DB_POOL_IDLE = float(os.getenv("DB_POOL_IDLE", "300"))
+
+# Per-query deadline (ms) and size of the background query pool
+QUERY_TIMEOUT_MS = int(os.getenv("QUERY_TIMEOUT_MS", "30000"))
+QUERY_WORKERS = int(os.getenv("QUERY_WORKERS", "4"))
+
+# Queries slower than this (ms) are logged with their EXPLAIN plan
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))
+
 ALLOWED_FIELDS = [
     'Patron_ID', 'Patron_Type_Definition', 'Total_Checkouts', 'Total_Renewals',
     'Age_Range', 'Home_Library_Definition', 'Circulation_Active_Month',
@@ -27,76 +52,546 @@ ALLOWED_FIELDS = [
     'Within_San_Francisco_County'
 ]
 
+# With the loaders' --schema-mode typed, years are stored as SMALLINT/int and
+# the active month as a YYYYMM integer, so they can be range-searched; input
+# is read with parse_year/parse_year_month from app/shared.py
+TEMPORAL_FIELDS = ["Circulation_Active_Month", "Circulation_Active_Year", "Year_Patron_Registered"]
+RANGE_FIELDS = ["Patron_ID", "Total_Checkouts", "Total_Renewals"]
+
+# Fixed statements run as server-side prepared statements
+PREPARED_QUERIES = prepared_queries(ALLOWED_FIELDS)
+
+# Lookup tables behind the foreign keys; their values are cached for LOOKUP_TTL seconds
+LOOKUP_TABLES = {
+    "Patron_Type_Definition": "PATRONTYPES",
+    "Age_Range": "AGERANGES",
+    "Home_Library_Definition": "LIBRARIES",
+    "Notice_Preference_Definition": "NOTICES",
+}
+LOOKUP_FIELDS = list(LOOKUP_TABLES)
+REQUIRED_FIELDS = {"Patron_Type_Definition", "Home_Library_Definition"}
+LOOKUP_TTL = float(os.getenv("LOOKUP_TTL", "300"))
+
+# Patron rows read by ID are cached (LRU, RECORD_CACHE_SIZE rows for
+# RECORD_CACHE_TTL seconds). RECORD_CACHE_FEED names a change-log table
+# polled every RECORD_CACHE_POLL seconds to drop rows changed elsewhere.
+RECORD_CACHE_SIZE = int(os.getenv("RECORD_CACHE_SIZE", "10000"))
+RECORD_CACHE_TTL = float(os.getenv("RECORD_CACHE_TTL", "60"))
+RECORD_CACHE_FEED = os.getenv("RECORD_CACHE_FEED", "")
+RECORD_CACHE_POLL = float(os.getenv("RECORD_CACHE_POLL", "2"))
+
 # Logs
 LOG_DIR = "logs"
 LOG_FILE = os.path.join(LOG_DIR, "app.log")
+LOG_BACKUPS = 3
+# Events are written by a background thread; LOG_SAMPLE keeps a fraction of
+# info events for busy actions, e.g. LOG_SAMPLE=search=0.1,refresh=0.25
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_BATCH = int(os.getenv("LOG_BATCH", "200"))
+LOG_SAMPLE = parse_sample(os.getenv("LOG_SAMPLE", ""))
 os.makedirs(LOG_DIR, exist_ok=True)
 
 logger = logging.getLogger("patron_app")
 logger.setLevel(logging.INFO)
 
-if not any(isinstance(h, RotatingFileHandler) for h in logger.handlers):
-    file_handler = RotatingFileHandler(LOG_FILE, maxBytes=2_000_000, backupCount=3)
-    file_handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(message)s'))
-    logger.addHandler(file_handler)
+start_log_writer(logger, LOG_FILE, LOG_BACKUPS, LOG_QUEUE_SIZE, LOG_BATCH)
 
 def log_event(level: str, action: str, **kwargs):
-    payload = {"action": action}
-    payload.update(kwargs)
-    line = json.dumps(payload, ensure_ascii=False)
-    if level.lower() == "error":
-        logger.error(line)
-    else:
-        logger.info(line)
+    """Queue a JSON log event for the writer thread (LOG_SAMPLE thins out busy info events)."""
+    emit_event(logger, LOG_SAMPLE, level, action, **kwargs)
+
+# shape_id -> query text, kept next to the logs so ids in rotated or
+# dropped log lines can always be looked up
+QUERY_SHAPES_FILE = os.path.join(LOG_DIR, "query_shapes.jsonl")
+
+@st.cache_resource
+def get_query_shapes():
+    return QueryShapes(QUERY_SHAPES_FILE, log_event)
+
+def shape_id(shape):
+    """Short id for a query shape; the full text is kept in QUERY_SHAPES_FILE."""
+    return get_query_shapes().id(shape)
+
+# Log viewer
+LOG_INDEX_DIR = os.path.join(LOG_DIR, ".index")
+
+@st.cache_resource
+def get_log_indexes():
+    return LogIndexes(LOG_INDEX_DIR)
+
+# Metrics
+METRICS_FILE = os.getenv("METRICS_FILE", os.path.join(LOG_DIR, "metrics.prom"))
+METRICS_INTERVAL = float(os.getenv("METRICS_INTERVAL", "15"))
+
+@st.cache_resource
+def get_metrics():
+    metrics = MetricsRegistry("mysql", METRICS_FILE, log_event)
+    metrics.add_gauges(lambda: log_gauges(logger))
+    metrics.start_writer(METRICS_INTERVAL)
+    return metrics
 
 # Database Pool
 @st.cache_resource
 def get_pool():
-    return pooling.MySQLConnectionPool(
-        pool_name="patron_pool",
-        pool_size=5,
+    pool = ConnectionPool(
+        DB_POOL_MIN, DB_POOL_MAX, DB_POOL_WAIT, DB_POOL_PING, DB_POOL_IDLE,
         host=DB_HOST,
         port=DB_PORT,
         user=DB_USER,
         password=DB_PASS,
         database=DB_NAME
     )
+    get_metrics().add_gauges(lambda: {f"pool_{k}": v for k, v in pool.metrics().items()})
+    return pool
 
-def get_conn():
-    conn = get_pool().get_connection()
-    conn.autocommit = True
-    return conn
+def is_connection_error(e):
+    return isinstance(e, (InterfaceError, OperationalError))
 
-def run_query(query, params=None, fetch="all", as_dict=True):
+def with_time_limit(query, timeout_ms):
+    """
+    Add a MAX_EXECUTION_TIME hint to SELECT statements so the server
+    aborts them once the deadline passes (other statements are unaffected).
+    """
+    q = query.lstrip()
+    if timeout_ms and q[:6].upper() == "SELECT":
+        return f"SELECT /*+ MAX_EXECUTION_TIME({int(timeout_ms)}) */{q[6:]}"
+    return query
+
+def run_query(query, params=None, fetch="all", as_dict=True, timeout_ms=QUERY_TIMEOUT_MS, job=None):
     """
     Safe query runner with timing + error logging.
     fetch: "all" | "one" | "none"
+    job: background job dict; holds the connection id while the connection
+    is checked out, so the query can be killed
     """
     t0 = time.time()
+    pool = get_pool()
+    conn = None
+    broken = False
     try:
-        conn = get_conn()
+        conn = pool.acquire()
+        if job is not None:
+            with job["lock"]:
+                job["conn_id"] = conn.connection_id
         cur = conn.cursor(dictionary=as_dict)
-        cur.execute(query, params or ())
+        cur.execute(with_time_limit(query, timeout_ms), params or ())
         if fetch == "one":
             rows = cur.fetchone()
         elif fetch == "none":
             rows = None
         else:
             rows = cur.fetchall()
-        conn.commit()
+        returned = len(rows) if fetch == "all" else cur.rowcount
         cur.close()
-        conn.close()
         dt = time.time() - t0
+        if dt * 1000 >= SLOW_QUERY_MS:
+            capture_slow_query(query, params, dt, returned)
+        return rows, dt
+    except Exception as e:
+        broken = is_connection_error(e)
+        dt = time.time() - t0
+        log_event("error", "db_error", shape_id=shape_id(normalize_sql(query)), params=str(params), elapsed_ms=round(dt * 1000, 1), error=str(e))
+        if dt * 1000 >= SLOW_QUERY_MS:
+            capture_slow_query(query, params, dt, None, error=str(e))
+        raise
+    finally:
+        if conn is not None:
+            if job is not None:
+                # Once released the connection may run another session's query
+                with job["lock"]:
+                    job["conn_id"] = None
+            pool.release(conn, broken)
+
+def run_prepared(name, params=(), fetch="none"):
+    """
+    Run one of PREPARED_QUERIES as a server-side prepared statement
+    (prepared once per connection, then only executed).
+    fetch: "all" | "one" | "none"
+    Statements without a result set return the number of affected rows.
+    """
+    query = PREPARED_QUERIES[name]
+    t0 = time.time()
+    pool = get_pool()
+    conn = None
+    broken = False
+    try:
+        conn = pool.acquire()
+        cur = pool.prepared(conn, query)
+        cur.execute(query, params)
+        rows = returned = cur.rowcount
+        if cur.description:
+            names = cur.column_names
+            rows = [dict(zip(names, r)) for r in cur.fetchall()]
+            returned = len(rows)
+            if fetch == "one":
+                rows = rows[0] if rows else None
+        dt = time.time() - t0
+        if dt * 1000 >= SLOW_QUERY_MS:
+            capture_slow_query(query, params, dt, returned)
         return rows, dt
     except Exception as e:
+        broken = is_connection_error(e)
         dt = time.time() - t0
-        log_event("error", "db_error", query=query, params=str(params), elapsed=f"{dt:.3f}s", error=str(e))
+        log_event("error", "db_error", shape_id=shape_id(normalize_sql(query)), params=str(params), elapsed_ms=round(dt * 1000, 1), error=str(e))
         raise
+    finally:
+        if conn is not None:
+            pool.release(conn, broken)
+
+# Slow queries
+@st.cache_resource
+def get_slow_log():
+    return SlowQueryLog()
+
+def normalize_sql(query):
+    """Query shape: literals and placeholders become ?, whitespace collapsed."""
+    q = re.sub(r"/\*.*?\*/", " ", query, flags=re.S)
+    q = re.sub(r"'(?:[^'\\]|\\.)*'", "?", q)
+    q = re.sub(r"\b\d+(\.\d+)?\b", "?", q)
+    q = q.replace("%s", "?")
+    return re.sub(r"\s+", " ", q).strip()
+
+def summarize_plan(plan):
+    """Access type, index and estimated rows examined from EXPLAIN FORMAT=JSON."""
+    tables = []
+
+    def walk(node):
+        if isinstance(node, dict):
+            if "table_name" in node and "access_type" in node:
+                tables.append(node)
+            for v in node.values():
+                walk(v)
+        elif isinstance(node, list):
+            for v in node:
+                walk(v)
+
+    walk(plan)
+    return {
+        "access": ", ".join(f"{t['table_name']}:{t['access_type']}" for t in tables) or None,
+        "index": ", ".join(t["key"] for t in tables if t.get("key")) or None,
+        "rows_examined": sum(int(t.get("rows_examined_per_scan", 0)) for t in tables),
+    }
+
+def explain_slow_query(query, params, dt, returned, error=None, explain=True):
+    """
+    Record a slow query. explain=False records it without a plan (an EXPLAIN
+    of the same shape is already running, or the pool has no idle connection).
+    """
+    entry = {
+        "ts": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "shape": normalize_sql(query),
+        "params": str(params),
+        "elapsed_ms": round(dt * 1000, 1),
+        "rows_returned": returned,
+        "rows_examined": None,
+        "access": None,
+        "index": None,
+        "plan": None,
+        "error": error,
+    }
+    if explain:
+        pool = get_pool()
+        conn = None
+        try:
+            conn = pool.acquire()
+            cur = conn.cursor()
+            cur.execute("EXPLAIN FORMAT=JSON " + query, params or ())
+            entry["plan"] = json.loads(cur.fetchone()[0])
+            cur.close()
+            entry.update(summarize_plan(entry["plan"]))
+        except Exception as e:
+            entry["error"] = entry["error"] or f"EXPLAIN failed: {e}"
+        finally:
+            if conn is not None:
+                pool.release(conn)
+            get_slow_log().end_explain(entry["shape"])
+    get_slow_log().add(entry)
+    log_event("info", "slow_query", shape_id=shape_id(entry["shape"]),
+              **{k: v for k, v in entry.items() if k not in ("plan", "shape")})
+
+def capture_slow_query(query, params, dt, returned, error=None):
+    """
+    EXPLAIN the query on a side thread so the caller gets its result right away.
+    At most one EXPLAIN per shape runs at a time, and none when every pooled
+    connection is busy (it would compete with user queries); those are
+    recorded without a plan.
+    """
+    if get_pool().metrics()["idle"] == 0 or not get_slow_log().begin_explain(normalize_sql(query)):
+        explain_slow_query(query, params, dt, returned, error, explain=False)
+        return
+    threading.Thread(
+        target=explain_slow_query, args=(query, params, dt, returned, error),
+        name="slow_query_explain", daemon=True,
+    ).start()
+
+# Background queries
+@st.cache_resource
+def get_executor():
+    return ThreadPoolExecutor(max_workers=QUERY_WORKERS, thread_name_prefix="patron_query")
+
+def submit_query(key, query, params=None, fetch="all", timeout_ms=QUERY_TIMEOUT_MS, **meta):
+    """
+    Run a query on the worker pool and keep the job in the session.
+    The result is picked up on a later rerun once the future is done.
+    meta: extra fields for logging when the result is shown
+    """
+    cancel_query(key)
+    job = {
+        "conn_id": None,
+        "lock": threading.Lock(),
+        "started": time.time(),
+        "timeout_ms": timeout_ms,
+        "cancelled": None,
+        "seen": False,
+        "meta": meta,
+    }
+    job["future"] = get_executor().submit(run_query, query, params, fetch, True, timeout_ms, job)
+    st.session_state[f"job_{key}"] = job
+    return job
+
+def get_job(key):
+    return st.session_state.get(f"job_{key}")
+
+def job_running(key):
+    job = get_job(key)
+    return job is not None and not job["future"].done()
+
+def cancel_query(key, reason="cancelled"):
+    """Stop a running background query with KILL QUERY on a separate connection."""
+    job = get_job(key)
+    if job is None or job["future"].done():
+        return
+    job["cancelled"] = reason
+    if job["future"].cancel():
+        return
+    # Held while killing so the worker can't release the connection to
+    # another session in between
+    with job["lock"]:
+        conn_id = job["conn_id"]
+        if not conn_id:
+            return
+        try:
+            killer = mysql.connector.connect(
+                host=DB_HOST, port=DB_PORT, user=DB_USER, password=DB_PASS, database=DB_NAME
+            )
+            cur = killer.cursor()
+            cur.execute(f"KILL QUERY {int(conn_id)}")
+            cur.close()
+            killer.close()
+        except Exception as e:
+            log_event("error", "cancel", conn_id=conn_id, error=str(e))
+
+def job_error_message(job, e):
+    if job["cancelled"] == "cancelled":
+        return "cancelled"
+    if job["cancelled"] == "timeout" or getattr(e, "errno", None) == 3024:
+        return f"exceeded the {job['timeout_ms'] / 1000:.0f}s limit"
+    return str(e)
+
+@st.fragment(run_every=1)
+def show_job_status(key, label):
+    """Running indicator with a cancel button; reruns the app once the job finishes."""
+    job = get_job(key)
+    if job is None:
+        return
+    if job["future"].done():
+        st.rerun()
+    elapsed = time.time() - job["started"]
+    if elapsed * 1000 > job["timeout_ms"] + 1000:
+        cancel_query(key, reason="timeout")
+    c1, c2 = st.columns([4, 1])
+    with c1:
+        st.info(f"⏳ {label} running for {elapsed:.0f}s...")
+    with c2:
+        if st.button("Cancel", key=f"cancel_{key}"):
+            cancel_query(key)
+            st.rerun()
+
+# Lookup values
+def load_lookups():
+    values = {}
+    for field, table in LOOKUP_TABLES.items():
+        rows, _ = run_query(f"SELECT {field} FROM {table} ORDER BY {field}", as_dict=False)
+        values[field] = [r[0] for r in rows]
+    return values
+
+@st.cache_resource
+def get_lookups():
+    return LookupCache(load_lookups, LOOKUP_TTL)
+
+def validate_lookups(values):
+    """Check lookup fields against the cached tables so invalid writes never reach MySQL."""
+    allowed = get_lookups().get()
+    errors = []
+    for field, value in values.items():
+        if value is None:
+            if field in REQUIRED_FIELDS:
+                errors.append(f"{field} is required.")
+        elif field in allowed and value not in allowed[field]:
+            errors.append(f"'{value}' is not a valid {field} (not in {LOOKUP_TABLES[field]}).")
+    return errors
+
+# Typed temporal columns
+@st.cache_resource
+def get_schema_mode():
+    """'typed' if PATRONS was created by the loader with --schema-mode typed, else 'text'."""
+    row, _ = run_query(
+        "SELECT DATA_TYPE FROM information_schema.COLUMNS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'PATRONS' AND COLUMN_NAME = 'Circulation_Active_Year'",
+        fetch="one", as_dict=False,
+    )
+    return "typed" if row and row[0] in ("smallint", "int", "mediumint") else "text"
+
+def convert_temporal(field, value, year=None, bound=None):
+    """
+    User input for a temporal field -> the value to store or compare with.
+    Unchanged in the text schema. bound="low"/"high" lets a bare year stand
+    for its first/last month in month ranges. Raises ValueError if unreadable.
+    """
+    if value is None or str(value).strip() == "":
+        return None
+    if get_schema_mode() != "typed":
+        return value
+    if field == "Circulation_Active_Month":
+        y = parse_year(value) if bound else None
+        if y is not None:
+            out = y * 100 + (1 if bound == "low" else 12)
+        else:
+            out = parse_year_month(value, year)
+        hint = "a month like 2022-11 or November 2022"
+    else:
+        out = parse_year(value)
+        hint = "a year like 2016"
+    if out is None:
+        raise ValueError(f"'{value}' is not {hint} for {field}.")
+    return out
+
+def range_fields():
+    return RANGE_FIELDS + (TEMPORAL_FIELDS if get_schema_mode() == "typed" else [])
+
+def range_bounds(field, low, high):
+    """(low, high) for a range search, either may be None; raises ValueError."""
+    def bound(v, which):
+        if v.strip() == "":
+            return None
+        if field in TEMPORAL_FIELDS:
+            return convert_temporal(field, v, bound=which)
+        try:
+            return int(v)
+        except ValueError:
+            raise ValueError(f"'{v}' is not a number for {field}.")
 
-def refresh_table():
-    rows, dt = run_query("SELECT * FROM PATRONS ORDER BY Patron_ID DESC")
-    st.caption(f"Fetched {len(rows)} row(s) in {dt:.3f}s • Last refresh: {time.strftime('%H:%M:%S')}")
-    return pd.DataFrame(rows) if rows else pd.DataFrame()
+    lo, hi = bound(low, "low"), bound(high, "high")
+    if lo is None and hi is None:
+        raise ValueError("Enter at least one bound.")
+    return lo, hi
+
+def range_filter(field, low, high):
+    """
+    WHERE clause and params for low <= field <= high. Month ranges also bound
+    Circulation_Active_Year, the partition key, so MySQL prunes partitions.
+    """
+    lo, hi = range_bounds(field, low, high)
+    clauses, params = [], []
+    if lo is not None:
+        clauses.append(f"{field} >= %s")
+        params.append(lo)
+    if hi is not None:
+        clauses.append(f"{field} <= %s")
+        params.append(hi)
+    if field == "Circulation_Active_Month":
+        if lo is not None:
+            clauses.append("Circulation_Active_Year >= %s")
+            params.append(lo // 100)
+        if hi is not None:
+            clauses.append("Circulation_Active_Year <= %s")
+            params.append(hi // 100)
+    return " AND ".join(clauses), params
+
+# Record cache
+def follow_change_feed(cache, table, interval):
+    """
+    Invalidate patrons changed outside this app. `table` is a change-log
+    table with an increasing Change_ID and the Patron_ID that changed.
+    """
+    last = None
+    while True:
+        try:
+            if last is None:
+                row, _ = run_query(f"SELECT COALESCE(MAX(Change_ID), 0) FROM {table}", fetch="one", as_dict=False)
+                last = row[0]
+            rows, _ = run_query(
+                f"SELECT Change_ID, Patron_ID FROM {table} WHERE Change_ID > %s ORDER BY Change_ID LIMIT 1000",
+                (last,), as_dict=False,
+            )
+            for change_id, patron_id in rows:
+                cache.invalidate(patron_id)
+                last = change_id
+        except Exception as e:
+            log_event("error", "record_cache_feed", table=table, error=str(e))
+            time.sleep(max(interval, 5))
+            continue
+        time.sleep(interval)
+
+@st.cache_resource
+def get_record_cache():
+    cache = RecordCache(RECORD_CACHE_SIZE, RECORD_CACHE_TTL)
+    get_metrics().add_gauges(lambda: {f"record_cache_{k}": v for k, v in cache.metrics().items()})
+    if RECORD_CACHE_FEED:
+        threading.Thread(
+            target=follow_change_feed, args=(cache, RECORD_CACHE_FEED, RECORD_CACHE_POLL),
+            name="record_cache_feed", daemon=True,
+        ).start()
+    return cache
+
+def get_patron(patron_id):
+    """
+    One patron by ID through the record cache.
+    Returns (row or None, seconds, True if served from the cache).
+    """
+    cache = get_record_cache()
+    t0 = time.time()
+    row = cache.get(patron_id)
+    if row is not None:
+        return row, time.time() - t0, True
+    token = cache.token()
+    row, dt = run_prepared("get_by_id", (patron_id,), fetch="one")
+    if row is not None:
+        cache.put(patron_id, row, token)
+    return row, dt, False
+
+def find_patron_ids(prefix, limit=10):
+    """Up to `limit` patrons whose ID starts with `prefix`, via range scans on the primary key."""
+    ranges = id_prefix_ranges(prefix)
+    if not ranges:
+        return []
+    where = " OR ".join(["Patron_ID BETWEEN %s AND %s"] * len(ranges))
+    params = [v for r in ranges for v in r]
+    rows, _ = run_query(f"SELECT * FROM PATRONS WHERE {where} ORDER BY Patron_ID LIMIT {int(limit)}", params)
+    return rows
+
+def patron_picker(label, key):
+    """
+    Typeahead for Patron_ID: one small indexed query for IDs starting with
+    the typed digits, with the selected patron's current fields shown.
+    Returns (patron_id, row) or (None, None).
+    """
+    prefix = st.text_input(f"{label} (type the first digits)", key=f"{key}_prefix").strip()
+    if not prefix:
+        return None, None
+    rows = find_patron_ids(prefix)
+    if not rows:
+        st.warning(f"No patron ID starts with '{prefix}'.")
+        return None, None
+    by_id = {r["Patron_ID"]: r for r in rows}
+
+    def describe(pid):
+        r = by_id[pid]
+        return f"{pid} · {r.get('Patron_Type_Definition') or '-'} · {r.get('Age_Range') or '-'} · {r.get('Home_Library_Definition') or '-'}"
+
+    patron_id = st.selectbox(label, list(by_id), format_func=describe, key=f"{key}_id")
+    st.dataframe(pd.DataFrame([by_id[patron_id]]), use_container_width=True, hide_index=True)
+    return patron_id, by_id[patron_id]
 
 # User Interface
 st.set_page_config(page_title="Patron Manager", layout="wide")
@@ -110,18 +605,41 @@ with st.sidebar:
     st.text_input("Database", value=DB_NAME, key="db", disabled=True)
     st.caption("Edit values in a .env file to change these.")
 
-tab_view, tab_add, tab_update, tab_search, tab_delete, tab_logs = st.tabs(
-    ["View All", "Add New", "Update", "Search", "Delete", "Logs"]
-)
+    with st.expander("Connection pool"):
+        try:
+            pm = get_pool().metrics()
+            st.progress(min(pm["utilization"], 1.0), text=f"{pm['in_use']}/{pm['max_size']} in use • {pm['idle']} idle • {pm['waiting']} waiting")
+            st.caption(
+                f"Checkout wait avg {pm['avg_wait_ms']:.1f} ms • max {pm['max_wait_ms']:.1f} ms • "
+                f"{pm['timeouts']} timeout(s) • {pm['stale_replaced']} stale replaced • "
+                f"prepared hit ratio {pm['prepared_hit_ratio']:.0%}"
+            )
+        except Exception as e:
+            st.caption(f"Pool unavailable: {e}")
+
+    with st.expander("Record cache"):
+        rc = get_record_cache()
+        cm = rc.metrics()
+        st.caption(
+            f"{cm['entries']}/{cm['max_entries']} patrons • {cm['bytes'] / 1024:.0f} KB • "
+            f"hit ratio {cm['hit_ratio']:.0%} ({cm['hits']} hits, {cm['misses']} misses) • "
+            f"{cm['evictions']} evicted • TTL {RECORD_CACHE_TTL:.0f}s"
+        )
+        if st.button("Clear record cache"):
+            rc.invalidate()
+
+# Only the selected section runs, so an interaction costs that section's queries only
+SECTIONS = ["View All", "Add New", "Update", "Search", "Delete", "Logs", "Metrics", "Slow Queries"]
+section = st.radio("Section", SECTIONS, horizontal=True, key="section", label_visibility="collapsed")
 
 # View
-with tab_view:
+if section == "View All":
     st.subheader("All patrons")
 
     c1, c2, c3 = st.columns([1, 1, 2])
     with c1:
         if st.button("🔄 Refresh now"):
-            st.rerun()
+            submit_query("view", "SELECT * FROM PATRONS ORDER BY Patron_ID DESC")
 
     default_auto = st.session_state.get("auto_refresh", False)
     default_interval = st.session_state.get("auto_interval", 5)
@@ -131,10 +649,8 @@ with tab_view:
     with c3:
         interval = st.slider("Interval (sec)", min_value=2, max_value=60, value=default_interval, key="auto_interval")
 
-    df = refresh_table()
-    st.dataframe(df, use_container_width=True)
-
     # Auto-refresh
+    due = get_job("view") is None
     if auto:
         if "last_refresh_ts" not in st.session_state:
             st.session_state.last_refresh_ts = time.time()
@@ -147,26 +663,53 @@ with tab_view:
 
         if elapsed >= interval:
             st.session_state.last_refresh_ts = time.time()
-            st.rerun()
-        else:
-            time.sleep(1)
-            st.rerun()
+            due = True
+
+    if due and not job_running("view"):
+        submit_query("view", "SELECT * FROM PATRONS ORDER BY Patron_ID DESC")
+
+    job = get_job("view")
+    if job_running("view"):
+        show_job_status("view", "Loading patrons")
+    else:
+        try:
+            rows, dt = job["future"].result()
+            if not job["seen"]:
+                get_metrics().observe("refresh", dt)
+                job["seen"] = True
+            st.caption(f"Fetched {len(rows)} row(s) in {dt:.3f}s • Last refresh: {time.strftime('%H:%M:%S', time.localtime(job['started']))}")
+            st.dataframe(pd.DataFrame(rows) if rows else pd.DataFrame(), use_container_width=True)
+        except Exception as e:
+            st.error(f"Load failed: {job_error_message(job, e)}")
+
+    if auto and not job_running("view"):
+        time.sleep(1)
+        st.rerun()
 
 # Add New
-with tab_add:
+if section == "Add New":
     st.subheader("Add new patron")
+    lookup_cache = get_lookups()
+    lookups = lookup_cache.get()
+    c1, c2 = st.columns([4, 1])
+    with c1:
+        st.caption(f"Dropdown values: lookup lists v{lookup_cache.version}, loaded {time.strftime('%H:%M:%S', time.localtime(lookup_cache.loaded_at))}")
+    with c2:
+        if st.button("Reload lists"):
+            lookup_cache.invalidate()
+            st.rerun()
     with st.form("add_patron"):
         c1, c2, c3 = st.columns(3)
         with c1:
-            patron_type = st.text_input("Patron_Type_Definition")
+            patron_type = st.selectbox("Patron_Type_Definition", lookups["Patron_Type_Definition"], index=None, placeholder="(none)")
             total_checkouts = st.number_input("Total_Checkouts", step=1, format="%d", placeholder="0")
             total_renewals = st.number_input("Total_Renewals", step=1, format="%d", placeholder="0")
-            age_range = st.text_input("Age_Range")
+            age_range = st.selectbox("Age_Range", lookups["Age_Range"], index=None, placeholder="(none)")
         with c2:
-            home_lib = st.text_input("Home_Library_Definition")
+            home_lib = st.selectbox("Home_Library_Definition", lookups["Home_Library_Definition"], index=None, placeholder="(none)")
             circ_month = st.text_input("Circulation_Active_Month")
             circ_year = st.text_input("Circulation_Active_Year")
-            notice_pref = st.text_input("Notice_Preference_Definition")
+            notice_pref = st.selectbox("Notice_Preference_Definition", lookups["Notice_Preference_Definition"], index=None, placeholder="(none)")
         with c3:
             provided_email = st.toggle("Provided_Email_Address (bool / nullable)", value=False)
             provided_email_null = st.checkbox("Set Provided_Email_Address = NULL", value=False)
@@ -176,6 +719,13 @@ with tab_add:
 
         submitted = st.form_submit_button("Insert")
         if submitted:
+            errors = []
+            try:
+                circ_year = convert_temporal("Circulation_Active_Year", circ_year)
+                circ_month = convert_temporal("Circulation_Active_Month", circ_month, circ_year)
+                year_reg = convert_temporal("Year_Patron_Registered", year_reg)
+            except ValueError as e:
+                errors.append(str(e))
             data = (
                 patron_type or None,
                 int(total_checkouts) if total_checkouts is not None else None,
@@ -189,41 +739,61 @@ with tab_add:
                 year_reg or None,
                 (None if sf_county_null else (1 if sf_county else 0)),
             )
-            q = """
-            INSERT INTO PATRONS (
-                Patron_Type_Definition, Total_Checkouts, Total_Renewals,
-                Age_Range, Home_Library_Definition, Circulation_Active_Month,
-                Circulation_Active_Year, Notice_Preference_Definition,
-                Provided_Email_Address, Year_Patron_Registered,
-                Within_San_Francisco_County
-            ) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
-            """
+            errors += validate_lookups(dict(zip(LOOKUP_FIELDS, (patron_type, age_range, home_lib, notice_pref))))
+            if errors:
+                log_event("info", "insert", status="invalid", errors=errors)
+                get_metrics().observe("insert", status="invalid")
+                for msg in errors:
+                    st.error(msg)
+                st.stop()
             try:
-                _, dt = run_query(q, data, fetch="none")
-                log_event("info", "insert", status="ok", elapsed=f"{dt:.3f}s", values=data)
+                _, dt = run_prepared("insert", data)
+                log_event("info", "insert", status="ok", elapsed_ms=round(dt * 1000, 1), values=data)
+                get_metrics().observe("insert", dt)
                 st.success(f"Inserted new patron in {dt:.3f}s")
+                st.session_state.pop("job_view", None)
                 st.rerun()
             except Exception as e:
+                if getattr(e, "errno", None) == 1452:
+                    lookup_cache.invalidate()  # lookup tables changed since they were cached
                 log_event("error", "insert", status="fail", error=str(e))
+                get_metrics().observe("insert", status="fail")
                 st.error(f"Insert failed: {e}")
 
 # Update
-with tab_update:
+if section == "Update":
     st.subheader("Update a field")
-    df_now = refresh_table()
-    id_list = df_now["Patron_ID"].tolist() if "Patron_ID" in df_now else []
-    patron_id = st.selectbox("Patron_ID", id_list) if id_list else st.number_input("Patron_ID", step=1)
-    field = st.selectbox("Field", ALLOWED_FIELDS, index=1)
-    new_val = st.text_input("New value (leave blank for NULL)")
+    patron_id, current = patron_picker("Patron_ID", key="update")
+    # The typed (partitioned) table has no primary key on Patron_ID, so
+    # changing an ID could create duplicates; there it can't be edited
+    editable = [f for f in ALLOWED_FIELDS if f != "Patron_ID" or get_schema_mode() != "typed"]
+    field = st.selectbox("Field", editable, index=editable.index("Patron_Type_Definition"))
+    if field in LOOKUP_FIELDS:
+        new_val = st.selectbox("New value", get_lookups().get()[field], index=None, placeholder="(NULL)") or ""
+    else:
+        new_val = st.text_input("New value (leave blank for NULL)")
 
-    if st.button("Update"):
+    if st.button("Update", disabled=patron_id is None):
         try:
-            if field not in ALLOWED_FIELDS:
+            if field not in editable:
                 st.error("Invalid field.")
                 st.stop()
 
             val = None if new_val.strip() == "" else new_val.strip()
 
+            if field in LOOKUP_FIELDS:
+                errors = validate_lookups({field: val})
+                if errors:
+                    st.error(" ".join(errors))
+                    st.stop()
+
+            if field in TEMPORAL_FIELDS:
+                try:
+                    val = convert_temporal(field, val, current and current.get("Circulation_Active_Year"))
+                except ValueError as e:
+                    st.error(str(e))
+                    st.stop()
+
             if field in ["Total_Checkouts", "Total_Renewals"] and val is not None:
                 val = int(val)
 
@@ -236,90 +806,229 @@ with tab_update:
                 else:
                     val = None  # treat unknown as NULL
 
-            if val is None:
-                q = f"UPDATE PATRONS SET {field} = NULL WHERE Patron_ID = %s"
-                _, dt = run_query(q, (patron_id,), fetch="none")
-            else:
-                q = f"UPDATE PATRONS SET {field} = %s WHERE Patron_ID = %s"
-                _, dt = run_query(q, (val, patron_id), fetch="none")
+            try:
+                _, dt = run_prepared(f"update_{field}", (val, patron_id))
+            finally:
+                get_record_cache().invalidate(patron_id)
 
-            log_event("info", "update", status="ok", patron_id=patron_id, field=field, value=val, elapsed=f"{dt:.3f}s")
+            log_event("info", "update", status="ok", patron_id=patron_id, field=field, value=val, elapsed_ms=round(dt * 1000, 1))
+            get_metrics().observe("update", dt)
             st.success(f"Updated Patron {patron_id} ({field}) in {dt:.3f}s")
+            st.session_state.pop("job_view", None)
             st.rerun()
         except Exception as e:
             log_event("error", "update", status="fail", patron_id=patron_id, field=field, value=new_val, error=str(e))
+            get_metrics().observe("update", status="fail")
             st.error(f"Update failed: {e}")
 
 # Search
-with tab_search:
+if section == "Search":
     st.subheader("Search patrons")
     col1, col2, col3 = st.columns([1,1,1])
     with col1:
         field = st.selectbox("Field", ALLOWED_FIELDS)
     with col2:
-        mode = st.radio("Match type", ["exact", "like"], horizontal=True, index=0)
+        mode = st.radio("Match type", ["exact", "like", "range"], horizontal=True, index=0)
     with col3:
         null_search = st.checkbox("Find rows where value IS NULL")
 
-    value = st.text_input("Value (ignored if 'IS NULL' is checked)")
+    if mode == "range":
+        r1, r2 = st.columns(2)
+        with r1:
+            low = st.text_input("From (blank for no lower bound)")
+        with r2:
+            high = st.text_input("To (blank for no upper bound)")
+        value = f"{low}..{high}"
+        if field in TEMPORAL_FIELDS:
+            st.caption("Years like 2016; months like 2022-11 (a year alone means its first/last month).")
+    else:
+        value = st.text_input("Value (ignored if 'IS NULL' is checked)")
     if st.button("Run search"):
+        st.session_state.pop("search_by_id", None)
+        if field == "Patron_ID" and mode == "exact" and not null_search and value.strip().isdigit():
+            # Point lookup: served from the record cache when possible
+            st.session_state.pop("job_search", None)
+            pid = int(value.strip())
+            try:
+                row, dt, hit = get_patron(pid)
+                log_event("info", "search", mode=mode, field=field, value=value, results=int(row is not None),
+                          cache="hit" if hit else "miss", elapsed_ms=round(dt * 1000, 1))
+                get_metrics().observe("search", dt)
+                st.session_state["search_by_id"] = {"rows": [row] if row else [], "dt": dt, "hit": hit, "started": time.time()}
+            except Exception as e:
+                log_event("error", "search", mode=mode, field=field, value=value, error=str(e))
+                get_metrics().observe("search", status="fail")
+                st.error(f"Search failed: {e}")
+        elif null_search:
+            submit_query("search", f"SELECT * FROM PATRONS WHERE {field} IS NULL",
+                         mode="is_null", field=field)
+        elif mode == "like":
+            submit_query("search", f"SELECT * FROM PATRONS WHERE {field} LIKE %s", (f"%{value}%",),
+                         mode=mode, field=field, value=value)
+        elif mode == "range":
+            if field not in range_fields():
+                st.error(f"Range search on {field} needs the typed schema (load with --schema-mode typed).")
+                st.stop()
+            try:
+                where, params = range_filter(field, low, high)
+            except ValueError as e:
+                st.error(str(e))
+                st.stop()
+            submit_query("search", f"SELECT * FROM PATRONS WHERE {where}", params,
+                         mode=mode, field=field, value=value)
+        else:
+            qval = value
+            if field in TEMPORAL_FIELDS:
+                try:
+                    qval = convert_temporal(field, value)
+                except ValueError as e:
+                    st.error(str(e))
+                    st.stop()
+            submit_query("search", f"SELECT * FROM PATRONS WHERE {field} = %s", (qval,),
+                         mode=mode, field=field, value=value)
+
+    point = st.session_state.get("search_by_id")
+    job = get_job("search")
+    if point is not None:
+        source = "record cache" if point["hit"] else "database"
+        st.caption(f"Lookup in {point['dt']:.3f}s from the {source} • Last refresh: {time.strftime('%H:%M:%S', time.localtime(point['started']))}")
+        st.dataframe(pd.DataFrame(point["rows"]), use_container_width=True)
+    elif job_running("search"):
+        show_job_status("search", "Search")
+    elif job is not None:
         try:
-            if null_search:
-                q = f"SELECT * FROM PATRONS WHERE {field} IS NULL"
-                rows, dt = run_query(q)
-                log_event("info", "search", mode="is_null", field=field, results=len(rows), elapsed=f"{dt:.3f}s")
-            else:
-                if mode == "like":
-                    q = f"SELECT * FROM PATRONS WHERE {field} LIKE %s"
-                    rows, dt = run_query(q, (f"%{value}%",))
-                else:
-                    q = f"SELECT * FROM PATRONS WHERE {field} = %s"
-                    rows, dt = run_query(q, (value,))
-                log_event("info", "search", mode=mode, field=field, value=value, results=len(rows), elapsed=f"{dt:.3f}s")
-            st.caption(f"Query in {dt:.3f}s • Last refresh: {time.strftime('%H:%M:%S')}")
+            rows, dt = job["future"].result()
+            if not job["seen"]:
+                log_event("info", "search", **job["meta"], results=len(rows), elapsed_ms=round(dt * 1000, 1))
+                get_metrics().observe("search", dt)
+            st.caption(f"Query in {dt:.3f}s • Last refresh: {time.strftime('%H:%M:%S', time.localtime(job['started']))}")
             st.dataframe(pd.DataFrame(rows), use_container_width=True)
         except Exception as e:
-            log_event("error", "search", mode=mode, field=field, value=value, error=str(e))
-            st.error(f"Search failed: {e}")
+            msg = job_error_message(job, e)
+            if not job["seen"]:
+                log_event("error", "search", **job["meta"], error=msg)
+                get_metrics().observe("search", status=job["cancelled"] or "fail")
+            st.error(f"Search failed: {msg}")
+        job["seen"] = True
 
 # Delete
-with tab_delete:
+if section == "Delete":
     st.subheader("Delete patron")
-    df_now = refresh_table()
-    id_list = df_now["Patron_ID"].tolist() if "Patron_ID" in df_now else []
-    del_id = st.selectbox("Patron_ID to delete", id_list) if id_list else st.number_input("Patron_ID", step=1)
-    if st.button("Delete", type="primary"):
+    del_id, _ = patron_picker("Patron_ID to delete", key="delete")
+    if st.button("Delete", type="primary", disabled=del_id is None):
         try:
-            row, _ = run_query("SELECT * FROM PATRONS WHERE Patron_ID = %s", (del_id,), fetch="one")
+            row, _, _ = get_patron(del_id)
             if not row:
                 st.error(f"No patron with ID {del_id} found.")
                 log_event("info", "delete", status="not_found", patron_id=del_id)
+                get_metrics().observe("delete", status="not_found")
             else:
-                _, dt = run_query("DELETE FROM PATRONS WHERE Patron_ID = %s", (del_id,), fetch="none")
-                log_event("info", "delete", status="ok", patron_id=del_id, elapsed=f"{dt:.3f}s")
-                st.success(f"Deleted Patron {del_id} in {dt:.3f}s")
-                st.rerun()
+                try:
+                    deleted, dt = run_prepared("delete", (del_id,))
+                finally:
+                    get_record_cache().invalidate(del_id)
+                # The cached row can be up to RECORD_CACHE_TTL old; someone else may have deleted it
+                if not deleted:
+                    st.error(f"No patron with ID {del_id} found.")
+                    log_event("info", "delete", status="not_found", patron_id=del_id, elapsed_ms=round(dt * 1000, 1))
+                    get_metrics().observe("delete", dt, status="not_found")
+                else:
+                    log_event("info", "delete", status="ok", patron_id=del_id, elapsed_ms=round(dt * 1000, 1))
+                    get_metrics().observe("delete", dt)
+                    st.success(f"Deleted Patron {del_id} in {dt:.3f}s")
+                    st.session_state.pop("job_view", None)
+                    st.rerun()
         except Exception as e:
             log_event("error", "delete", status="fail", patron_id=del_id, error=str(e))
+            get_metrics().observe("delete", status="fail")
             st.error(f"Delete failed: {e}")
 
 # Logs
-with tab_logs:
+if section == "Logs":
     st.subheader("Application logs")
     colA, colB = st.columns([1, 3])
     with colA:
         max_lines = st.number_input("Show last N lines", min_value=10, max_value=10000, value=500, step=10)
+        files = log_files(LOG_FILE, LOG_BACKUPS)
+        indexes = get_log_indexes().current(files)
+        actions = sorted(set().union(*(idx["actions"] for _, idx in indexes)))
+        statuses = sorted(set().union(*(idx["statuses"] for _, idx in indexes)))
+        f_action = st.selectbox("Action", ["(any)"] + actions)
+        f_status = st.selectbox("Status", ["(any)"] + statuses)
+        f_level = st.selectbox("Level", ["(any)", "INFO", "ERROR"])
+        windows = {"any time": None, "last 15 minutes": 900, "last hour": 3600, "last 24 hours": 86400, "last 7 days": 604800}
+        f_window = st.selectbox("Time", list(windows))
         if st.button("Refresh logs"):
             st.rerun()
     with colB:
         if os.path.exists(LOG_FILE):
-            def tail(path, n=500):
-                with open(path, "r", encoding="utf-8", errors="ignore") as f:
-                    lines = f.readlines()
-                return "".join(lines[-n:])
-            content = tail(LOG_FILE, int(max_lines))
-            st.code(content or "(no log content yet)", language="text")
+            filtered = f_action != "(any)" or f_status != "(any)" or f_level != "(any)" or windows[f_window]
+            if filtered:
+                lines = search_logs(
+                    indexes,
+                    action=None if f_action == "(any)" else f_action,
+                    status=None if f_status == "(any)" else f_status,
+                    level=None if f_level == "(any)" else f_level,
+                    since=time.time() - windows[f_window] if windows[f_window] else None,
+                    limit=int(max_lines),
+                )
+                st.caption(f"{len(lines)} matching line(s), newest first")
+            else:
+                lines = tail_logs(files, int(max_lines))
+            st.code("\n".join(lines) or "(no log content yet)", language="text")
             with open(LOG_FILE, "rb") as f:
                 st.download_button("Download app.log", f, file_name="app.log", mime="text/plain")
         else:
             st.info("No logs yet. Perform an action (add/update/delete) to generate logs.")
+
+# Metrics
+if section == "Metrics":
+    st.subheader("Latency metrics")
+    metrics = get_metrics()
+    rows = metrics.snapshot()
+    if rows:
+        mdf = pd.DataFrame(rows)
+        st.dataframe(mdf.round(2), use_container_width=True)
+        timed = mdf[mdf["status"] == "ok"].dropna(subset=["p95_ms"])
+        if not timed.empty:
+            st.bar_chart(timed.set_index("action")[["p50_ms", "p95_ms", "p99_ms"]])
+    else:
+        st.info("No operations recorded yet. Perform an action to collect metrics.")
+
+    gauges = metrics.gauges()
+    if gauges:
+        st.json(gauges)
+
+    st.caption(f"Written to {METRICS_FILE} every {METRICS_INTERVAL:.0f}s (counts reset when the app restarts).")
+    if st.button("Write metrics now"):
+        metrics.write()
+        st.success(f"Wrote {METRICS_FILE}")
+
+# Slow Queries
+if section == "Slow Queries":
+    st.subheader("Slow queries")
+    st.caption(f"Queries slower than {SLOW_QUERY_MS:.0f} ms (SLOW_QUERY_MS) since the app started, grouped by query shape.")
+    entries = get_slow_log().entries()
+    if entries:
+        sdf = pd.DataFrame(entries)
+        groups = sdf.groupby("shape").agg(
+            count=("elapsed_ms", "size"),
+            avg_ms=("elapsed_ms", "mean"),
+            max_ms=("elapsed_ms", "max"),
+            rows_examined=("rows_examined", "max"),
+            rows_returned=("rows_returned", "max"),
+            access=("access", "last"),
+            index=("index", "last"),
+            last_seen=("ts", "last"),
+        ).sort_values("max_ms", ascending=False)
+        st.dataframe(groups.reset_index().round(1), use_container_width=True)
+
+        shape = st.selectbox("Show latest plan for", groups.index.tolist())
+        latest = sdf[sdf["shape"] == shape].iloc[-1]
+        st.code(f"{shape}\nparams: {latest['params']}", language="sql")
+        if latest["error"]:
+            st.warning(latest["error"])
+        if latest["plan"] is not None:
+            st.json(latest["plan"], expanded=False)
+    else:
+        st.info("No slow queries recorded yet.")
@@ -0,0 +1,158 @@
+"""
+MySQL connection pool and the statements the app runs as server-side
+prepared statements. Kept free of Streamlit so scripts/load_test.py can
+drive the same pool and statements as the app.
+"""
+import time
+import threading
+
+import mysql.connector
+from mysql.connector.errors import PoolError
+
+INSERT_QUERY = """
+INSERT INTO PATRONS (
+    Patron_Type_Definition, Total_Checkouts, Total_Renewals,
+    Age_Range, Home_Library_Definition, Circulation_Active_Month,
+    Circulation_Active_Year, Notice_Preference_Definition,
+    Provided_Email_Address, Year_Patron_Registered,
+    Within_San_Francisco_County
+) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
+"""
+
+def prepared_queries(fields):
+    """Fixed statements by name: insert, get_by_id, delete and update_<field> for every field."""
+    queries = {
+        "insert": INSERT_QUERY,
+        "get_by_id": "SELECT * FROM PATRONS WHERE Patron_ID = %s",
+        "delete": "DELETE FROM PATRONS WHERE Patron_ID = %s",
+    }
+    for f in fields:
+        queries[f"update_{f}"] = f"UPDATE PATRONS SET {f} = %s WHERE Patron_ID = %s"
+    return queries
+
+class ConnectionPool:
+    """
+    Elastic MySQL connection pool with a wait queue.
+    Connections are autocommit, health-checked before reuse and keep their
+    own cache of prepared statements.
+    """
+
+    def __init__(self, min_size, max_size, wait, ping, idle, **conn_args):
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size, 1)
+        self.wait = wait
+        self.ping = ping
+        self.idle = idle
+        self.conn_args = conn_args
+        self._cond = threading.Condition()
+        self._idle = []  # (conn, last_used), most recently used last
+        self._size = 0
+        self._waiting = 0
+        self._prepared = {}  # id(conn) -> {sql: prepared cursor}
+        self.counters = {
+            "checkouts": 0, "wait_total": 0.0, "wait_max": 0.0, "timeouts": 0,
+            "stale": 0, "prepared_hits": 0, "prepared_misses": 0,
+        }
+        for _ in range(min_size):
+            self._idle.append((self._connect(), time.time()))
+            self._size += 1
+
+    def _connect(self):
+        conn = mysql.connector.connect(**self.conn_args)
+        conn.autocommit = True
+        return conn
+
+    def _close(self, conn):
+        self._prepared.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def acquire(self):
+        """Check out a connection, waiting for one if the pool is at max_size."""
+        t0 = time.time()
+        with self._cond:
+            self._waiting += 1
+            try:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = t0 + self.wait - time.time()
+                    if remaining <= 0:
+                        self.counters["timeouts"] += 1
+                        raise PoolError(f"No free connection after {self.wait:.1f}s ({self.max_size} in use)")
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                else:
+                    conn, last_used = None, None
+                    self._size += 1
+            finally:
+                self._waiting -= 1
+            waited = time.time() - t0
+            self.counters["checkouts"] += 1
+            self.counters["wait_total"] += waited
+            self.counters["wait_max"] = max(self.counters["wait_max"], waited)
+
+        try:
+            if conn is None:
+                conn = self._connect()
+            elif time.time() - last_used > self.ping:
+                try:
+                    conn.ping(reconnect=False)
+                except Exception:
+                    self.counters["stale"] += 1
+                    self._close(conn)
+                    conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        return conn
+
+    def release(self, conn, broken=False):
+        """Return a connection; broken ones are closed and extra idle ones trimmed."""
+        now = time.time()
+        with self._cond:
+            if broken:
+                self._close(conn)
+                self._size -= 1
+            else:
+                self._idle.append((conn, now))
+            while self._size > self.min_size and self._idle and now - self._idle[0][1] > self.idle:
+                old, _ = self._idle.pop(0)
+                self._close(old)
+                self._size -= 1
+            self._cond.notify()
+
+    def prepared(self, conn, sql):
+        """Prepared cursor for `sql` on this connection (prepared on first use)."""
+        stmts = self._prepared.setdefault(id(conn), {})
+        cur = stmts.get(sql)
+        if cur is None:
+            cur = conn.cursor(prepared=True)
+            stmts[sql] = cur
+            self.counters["prepared_misses"] += 1
+        else:
+            self.counters["prepared_hits"] += 1
+        return cur
+
+    def metrics(self):
+        with self._cond:
+            in_use = self._size - len(self._idle)
+            c = self.counters
+            lookups = c["prepared_hits"] + c["prepared_misses"]
+            return {
+                "size": self._size,
+                "in_use": in_use,
+                "idle": len(self._idle),
+                "waiting": self._waiting,
+                "max_size": self.max_size,
+                "utilization": in_use / self.max_size,
+                "checkouts": c["checkouts"],
+                "avg_wait_ms": 1000 * c["wait_total"] / c["checkouts"] if c["checkouts"] else 0.0,
+                "max_wait_ms": 1000 * c["wait_max"],
+                "timeouts": c["timeouts"],
+                "stale_replaced": c["stale"],
+                "prepared_hit_ratio": c["prepared_hits"] / lookups if lookups else 0.0,
+            }
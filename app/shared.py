@@ -0,0 +1,623 @@
+"""
+Code shared by the MySQL app (app/app.py) and the MongoDB app
+(mongo/app.py). Nothing here imports Streamlit or a database driver; the
+apps keep the st.cache_resource singletons and pass in their own settings.
+"""
+import os
+import re
+import json
+import time
+import queue
+import atexit
+import random
+import sys
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, deque
+from logging.handlers import QueueHandler, RotatingFileHandler
+
+# Event logging
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+
+def parse_sample(spec):
+    """LOG_SAMPLE setting 'search=0.1,refresh=0.25' -> {action: rate}."""
+    return {
+        a.strip(): float(r) for a, r in
+        (item.split("=", 1) for item in spec.split(",") if "=" in item)
+    }
+
+class JsonFormatter(logging.Formatter):
+    """Serializes dict messages to compact JSON (runs in the writer thread)."""
+
+    def format(self, record):
+        if isinstance(record.msg, dict):
+            record.msg = json.dumps(record.msg, ensure_ascii=False, separators=(",", ":"), default=str)
+        return super().format(record)
+
+class BatchRotatingFileHandler(RotatingFileHandler):
+    """RotatingFileHandler that is flushed once per batch instead of once per record."""
+
+    def flush(self):
+        pass
+
+    def flush_batch(self):
+        super().flush()
+
+class DroppingQueueHandler(QueueHandler):
+    """Hands records to the writer thread; drops them (counted) rather than block when the queue is full."""
+
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record  # formatting happens in the writer thread
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+def batch_writer(q, handler, batch_size):
+    """Write queued records in batches with one flush per batch; None stops the writer."""
+    while True:
+        batch = [q.get()]
+        while len(batch) < batch_size:
+            try:
+                batch.append(q.get_nowait())
+            except queue.Empty:
+                break
+        for record in batch:
+            if record is None:
+                handler.flush_batch()
+                return
+            handler.handle(record)
+        handler.flush_batch()
+
+def start_log_writer(logger, path, backups, queue_size, batch_size):
+    """Attach the queue handler and start the writer thread, once per process."""
+    if any(isinstance(h, QueueHandler) for h in logger.handlers):
+        return
+    log_queue = queue.Queue(maxsize=queue_size)
+    file_handler = BatchRotatingFileHandler(path, maxBytes=2_000_000, backupCount=backups)
+    file_handler.setFormatter(JsonFormatter(LOG_FORMAT))
+    logger.addHandler(DroppingQueueHandler(log_queue))
+    log_writer = threading.Thread(
+        target=batch_writer, args=(log_queue, file_handler, batch_size), name="log_writer", daemon=True
+    )
+    log_writer.start()
+    atexit.register(lambda q=log_queue, t=log_writer: (q.put(None), t.join(timeout=2)))
+
+def log_gauges(logger):
+    """Writer queue depth and records dropped because it was full."""
+    return {
+        "log_queue_depth": sum(h.queue.qsize() for h in logger.handlers if isinstance(h, QueueHandler)),
+        "log_dropped": sum(getattr(h, "dropped", 0) for h in logger.handlers),
+    }
+
+def emit_event(logger, sample, level, action, **kwargs):
+    """
+    Queue a JSON log event; serialization and file I/O happen in the writer thread.
+    Info events for actions in `sample` are kept at that rate and tagged with it.
+    """
+    rate = sample.get(action)
+    if rate is not None and level.lower() != "error":
+        if random.random() >= rate:
+            return
+        kwargs["sample"] = rate
+    payload = {"action": action}
+    payload.update(kwargs)
+    if level.lower() == "error":
+        logger.error(payload)
+    else:
+        logger.info(payload)
+
+class QueryShapes:
+    """
+    Short ids for query shapes. The first time a shape is seen its text is
+    appended to `path` (never rotated, read back at startup) and also logged
+    as a query_shape event, so ids in rotated or dropped log lines can always
+    be looked up.
+    """
+
+    def __init__(self, path, log_event):
+        self.path = path
+        self.log_event = log_event
+        self._lock = threading.Lock()
+        self._shapes = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        d = json.loads(line)
+                        self._shapes[d["shape_id"]] = d["shape"]
+                    except (ValueError, KeyError):
+                        pass
+
+    def id(self, shape):
+        sid = hashlib.sha1(shape.encode("utf-8")).hexdigest()[:10]
+        with self._lock:
+            if sid in self._shapes:
+                return sid
+            self._shapes[sid] = shape
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"shape_id": sid, "shape": shape}, ensure_ascii=False) + "\n")
+            except OSError:
+                pass
+        self.log_event("info", "query_shape", shape_id=sid, shape=shape)
+        return sid
+
+# Log viewer
+LOG_LINE = re.compile(r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}),\d+ \[(\w+)\] (.*)$")
+
+def log_files(log_file, backups):
+    """app.log followed by its rotated backups, newest to oldest."""
+    files = [log_file] + [f"{log_file}.{i}" for i in range(1, backups + 1)]
+    return [f for f in files if os.path.exists(f)]
+
+def tail_lines(path, n, block=8192):
+    """Last n lines of a file, reading backwards from the end in blocks."""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        data = b""
+        while pos > 0 and data.count(b"\n") <= n:
+            step = min(block, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    lines = data.splitlines()
+    return [l.decode("utf-8", errors="ignore") for l in lines[-n:]] if n > 0 else []
+
+def tail_logs(files, n):
+    """Last n lines across app.log and the rotated backups (log_files()), oldest first."""
+    lines = []
+    for path in files:
+        lines = tail_lines(path, n - len(lines)) + lines
+        if len(lines) >= n:
+            break
+    return lines
+
+def parse_log_line(line):
+    """(epoch seconds, level, action, status) for a log line, or None."""
+    m = LOG_LINE.match(line)
+    if not m:
+        return None
+    ts = int(time.mktime(time.strptime(m.group(1), "%Y-%m-%d %H:%M:%S")))
+    action = status = None
+    try:
+        payload = json.loads(m.group(3))
+        action, status = payload.get("action"), payload.get("status")
+    except ValueError:
+        pass
+    return ts, m.group(2), action, status
+
+class LogIndexes:
+    """
+    Offset indexes of the log files: [offset, ts, level, action, status] per
+    line, plus the distinct actions and statuses. Kept in memory keyed by a
+    hash of each file's first line, so they follow the files through rotation
+    and only bytes appended since the last call are parsed. Checkpointed to
+    index_dir at most every `save_every` seconds so a restart doesn't
+    reparse the whole log.
+    """
+
+    def __init__(self, index_dir, save_every=30):
+        self.index_dir = index_dir
+        self.save_every = save_every
+        self._lock = threading.Lock()
+        self._indexes = {}
+
+    def _load(self, sig):
+        idx_path = os.path.join(self.index_dir, sig + ".json")
+        idx = {"size": 0, "entries": [], "saved_at": 0.0}
+        if os.path.exists(idx_path):
+            try:
+                with open(idx_path, "r", encoding="utf-8") as f:
+                    idx = json.load(f)
+                idx["saved_at"] = time.time()
+            except ValueError:
+                pass
+        idx["actions"] = {e[3] for e in idx["entries"] if e[3]}
+        idx["statuses"] = {e[4] for e in idx["entries"] if e[4]}
+        return idx
+
+    def _save(self, sig, idx):
+        idx_path = os.path.join(self.index_dir, sig + ".json")
+        os.makedirs(self.index_dir, exist_ok=True)
+        tmp = idx_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"size": idx["size"], "entries": idx["entries"]}, f, separators=(",", ":"))
+        os.replace(tmp, idx_path)
+        idx["saved_at"] = time.time()
+
+    def _update(self, path):
+        with open(path, "rb") as f:
+            sig = hashlib.sha1(f.readline()).hexdigest()[:16]
+        idx = self._indexes.get(sig)
+        if idx is None:
+            idx = self._indexes[sig] = self._load(sig)
+
+        size = os.path.getsize(path)
+        if size < idx["size"]:
+            idx = self._indexes[sig] = {"size": 0, "entries": [], "actions": set(), "statuses": set(), "saved_at": 0.0}
+        if size > idx["size"]:
+            offset = idx["size"]
+            with open(path, "rb") as f:
+                f.seek(offset)
+                for raw in f:
+                    if not raw.endswith(b"\n"):
+                        break  # line still being written
+                    parsed = parse_log_line(raw.decode("utf-8", errors="ignore").rstrip("\r\n"))
+                    if parsed:
+                        idx["entries"].append([offset, *parsed])
+                        if parsed[2]:
+                            idx["actions"].add(parsed[2])
+                        if parsed[3]:
+                            idx["statuses"].add(parsed[3])
+                    offset += len(raw)
+            idx["size"] = offset
+            if time.time() - idx["saved_at"] >= self.save_every:
+                self._save(sig, idx)
+        return sig, idx
+
+    def current(self, files):
+        """[(path, index)] for the current log files (log_files()), newest first; indexes of rotated-out logs are dropped."""
+        with self._lock:
+            indexes = [(path, *self._update(path)) for path in files]
+            keep = {sig for _, sig, _ in indexes}
+            for sig in [s for s in self._indexes if s not in keep]:
+                del self._indexes[sig]
+            for name in os.listdir(self.index_dir) if os.path.isdir(self.index_dir) else []:
+                if name.endswith(".json") and name[:-5] not in keep:
+                    os.remove(os.path.join(self.index_dir, name))
+            return [(path, idx) for path, _, idx in indexes]
+
+def search_logs(indexes, action=None, status=None, level=None, since=None, limit=500):
+    """Matching lines via the offset indexes (LogIndexes.current()), newest first."""
+    lines = []
+    for path, idx in indexes:
+        hits = []
+        for offset, ts, lvl, act, sts in reversed(idx["entries"]):
+            if since is not None and ts < since:
+                break
+            if (action is None or act == action) and (status is None or sts == status) and (level is None or lvl == level):
+                hits.append(offset)
+                if len(lines) + len(hits) >= limit:
+                    break
+        with open(path, "rb") as f:
+            for offset in hits:
+                f.seek(offset)
+                lines.append(f.readline().decode("utf-8", errors="ignore").rstrip("\r\n"))
+        entries = idx["entries"]
+        if len(lines) >= limit or (since is not None and entries and entries[0][1] < since):
+            break
+    return lines
+
+# Metrics
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class MetricsRegistry:
+    """
+    In-process counters and latency histograms per (action, status).
+    Written to `path` as Prometheus text (or JSON if the name ends in .json).
+    """
+
+    def __init__(self, backend, path, log_event):
+        self.backend = backend
+        self.path = path
+        self._log_event = log_event
+        self._lock = threading.Lock()
+        self._series = {}
+        self._gauges = []  # callables returning {name: value}
+
+    def observe(self, action, seconds=None, status="ok"):
+        """Count one operation; seconds=None counts it without a latency sample."""
+        with self._lock:
+            s = self._series.get((action, status))
+            if s is None:
+                s = {"count": 0, "timed": 0, "sum": 0.0, "max": 0.0, "buckets": [0] * (len(LATENCY_BUCKETS) + 1)}
+                self._series[(action, status)] = s
+            s["count"] += 1
+            if seconds is None:
+                return
+            s["timed"] += 1
+            s["sum"] += seconds
+            s["max"] = max(s["max"], seconds)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    s["buckets"][i] += 1
+                    break
+            else:
+                s["buckets"][-1] += 1
+
+    def add_gauges(self, fn):
+        self._gauges.append(fn)
+
+    @staticmethod
+    def _quantile(s, q):
+        """Estimate a quantile by interpolating inside the histogram bucket."""
+        if not s["timed"]:
+            return None
+        rank = q * s["timed"]
+        cum, lower = 0, 0.0
+        for bound, n in zip(LATENCY_BUCKETS + (s["max"],), s["buckets"]):
+            if n and cum + n >= rank:
+                return min(lower + (bound - lower) * (rank - cum) / n, s["max"])
+            cum += n
+            lower = bound
+        return s["max"]
+
+    def snapshot(self):
+        """One row per (action, status) with count, mean and p50/p95/p99 in ms."""
+        with self._lock:
+            series = {k: dict(v, buckets=list(v["buckets"])) for k, v in self._series.items()}
+        rows = []
+        for (action, status), s in sorted(series.items()):
+            row = {"backend": self.backend, "action": action, "status": status, "count": s["count"]}
+            row["mean_ms"] = 1000 * s["sum"] / s["timed"] if s["timed"] else None
+            for name, q in (("p50_ms", 0.50), ("p95_ms", 0.95), ("p99_ms", 0.99)):
+                v = self._quantile(s, q)
+                row[name] = 1000 * v if v is not None else None
+            row["max_ms"] = 1000 * s["max"] if s["timed"] else None
+            rows.append(row)
+        return rows
+
+    def gauges(self):
+        values = {}
+        for fn in self._gauges:
+            try:
+                values.update(fn())
+            except Exception:
+                pass
+        return values
+
+    def to_prometheus(self):
+        with self._lock:
+            series = {k: dict(v, buckets=list(v["buckets"])) for k, v in self._series.items()}
+        b = f'backend="{self.backend}"'
+        lines = [
+            "# HELP patron_app_operations_total Operations by action and status.",
+            "# TYPE patron_app_operations_total counter",
+        ]
+        for (action, status), s in sorted(series.items()):
+            lines.append(f'patron_app_operations_total{{{b},action="{action}",status="{status}"}} {s["count"]}')
+        lines += [
+            "# HELP patron_app_latency_seconds Operation latency by action and status.",
+            "# TYPE patron_app_latency_seconds histogram",
+        ]
+        for (action, status), s in sorted(series.items()):
+            labels = f'{b},action="{action}",status="{status}"'
+            cum = 0
+            for bound, n in zip(LATENCY_BUCKETS, s["buckets"]):
+                cum += n
+                lines.append(f'patron_app_latency_seconds_bucket{{{labels},le="{bound}"}} {cum}')
+            lines.append(f'patron_app_latency_seconds_bucket{{{labels},le="+Inf"}} {s["timed"]}')
+            lines.append(f'patron_app_latency_seconds_sum{{{labels}}} {s["sum"]:.6f}')
+            lines.append(f'patron_app_latency_seconds_count{{{labels}}} {s["timed"]}')
+        for name, value in sorted(self.gauges().items()):
+            lines.append(f"# TYPE patron_app_{name} gauge")
+            lines.append(f"patron_app_{name}{{{b}}} {value}")
+        return "\n".join(lines) + "\n"
+
+    def to_json(self):
+        return json.dumps({
+            "backend": self.backend,
+            "written_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "operations": self.snapshot(),
+            "gauges": self.gauges(),
+        }, indent=2)
+
+    def write(self):
+        """Write atomically so a scraper never reads a half-written file."""
+        path = self.path
+        content = self.to_json() if path.endswith(".json") else self.to_prometheus()
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp, path)
+
+    def start_writer(self, interval):
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.write()
+                except Exception as e:
+                    self._log_event("error", "metrics_write", path=self.path, error=str(e))
+
+        threading.Thread(target=loop, name="metrics_writer", daemon=True).start()
+
+# Slow queries
+class SlowQueryLog:
+    """Most recent slow queries with their plans, grouped by shape in the Slow Queries tab."""
+
+    def __init__(self, size=500):
+        self._lock = threading.Lock()
+        self._entries = deque(maxlen=size)
+        self._explaining = set()
+
+    def add(self, entry):
+        with self._lock:
+            self._entries.append(entry)
+
+    def begin_explain(self, shape):
+        """False if an explain of this shape is already running."""
+        with self._lock:
+            if shape in self._explaining:
+                return False
+            self._explaining.add(shape)
+            return True
+
+    def end_explain(self, shape):
+        with self._lock:
+            self._explaining.discard(shape)
+
+    def entries(self):
+        with self._lock:
+            return list(self._entries)
+
+# Lookup values
+class LookupCache:
+    """
+    Allowed values of the lookup fields, shared by all sessions.
+    Reloaded when older than `ttl` seconds or after invalidate(); every
+    reload bumps `version`.
+    """
+
+    def __init__(self, loader, ttl):
+        self.loader = loader
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.values = {}
+        self.version = 0
+        self.loaded_at = 0.0
+
+    def get(self):
+        with self._lock:
+            if not self.values or time.time() - self.loaded_at > self.ttl:
+                self.values = self.loader()
+                self.loaded_at = time.time()
+                self.version += 1
+            return self.values
+
+    def invalidate(self):
+        with self._lock:
+            self.loaded_at = 0.0
+
+# Record cache
+class RecordCache:
+    """
+    Bounded LRU cache of patron rows keyed by Patron_ID, shared by all sessions.
+    Entries expire after `ttl` seconds. Writes call invalidate(); a read that
+    started before an invalidation does not put its (possibly old) row back.
+    Missing patrons are not cached, so inserts need no invalidation.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._rows = OrderedDict()  # id -> (expires, row, size)
+        self._epoch = 0
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    @staticmethod
+    def _size(row):
+        return sys.getsizeof(row) + sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in row.items())
+
+    def _drop(self, key):
+        _, _, size = self._rows.pop(key)
+        self.bytes -= size
+
+    def get(self, key):
+        with self._lock:
+            entry = self._rows.get(key)
+            if entry is not None and entry[0] < time.time():
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._rows.move_to_end(key)
+            self.hits += 1
+            return dict(entry[1])
+
+    def token(self):
+        """Taken before reading from the database and passed to put()."""
+        return self._epoch
+
+    def put(self, key, row, token):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            if token != self._epoch:
+                return
+            if key in self._rows:
+                self._drop(key)
+            size = self._size(row)
+            self._rows[key] = (time.time() + self.ttl, dict(row), size)
+            self.bytes += size
+            while len(self._rows) > self.max_entries:
+                self._drop(next(iter(self._rows)))
+                self.evictions += 1
+
+    def invalidate(self, key=None):
+        """Forget one patron, or everything when key is None."""
+        with self._lock:
+            self._epoch += 1
+            self.invalidations += 1
+            if key is None:
+                self._rows.clear()
+                self.bytes = 0
+            elif key in self._rows:
+                self._drop(key)
+
+    def metrics(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._rows),
+                "max_entries": self.max_entries,
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+# Typed temporal columns
+# Accept more input forms than scripts/load_table_to_mysql.py, which is the
+# source of truth for the stored encoding
+MONTHS = ["january", "february", "march", "april", "may", "june", "july",
+          "august", "september", "october", "november", "december"]
+
+def parse_year(value):
+    """'2016' -> 2016; 'None', '' or anything else -> None."""
+    v = str(value if value is not None else "").strip()
+    return int(v) if v.isdigit() and 1800 <= int(v) <= 2200 else None
+
+def parse_year_month(value, year=None):
+    """
+    '2022-11', '202211', 'November 2022' or 'Nov 2022' -> 202211. A month
+    name or number alone is combined with `year`. None if it can't be read.
+    """
+    v = str(value if value is not None else "").strip().lower()
+    m = re.fullmatch(r"(\d{4})-?(\d{1,2})", v)
+    if m:
+        y, n = int(m[1]), int(m[2])
+    else:
+        parts = v.replace(",", " ").split()
+        if not parts or len(parts) > 2:
+            return None
+        y = parse_year(parts[1]) if len(parts) == 2 else year
+        name = parts[0]
+        if name.isdigit():
+            n = int(name)
+        else:
+            n = next((i + 1 for i, month in enumerate(MONTHS) if len(name) >= 3 and month.startswith(name)), None)
+    if y is None or n is None or not 1 <= n <= 12:
+        return None
+    return y * 100 + n
+
+# Patron picker
+def id_prefix_ranges(prefix, max_id=2**31 - 1):
+    """
+    Patron_ID ranges whose decimal form starts with `prefix`:
+    "43" -> [43, 43], [430, 439], [4300, 4399], ...
+    """
+    if not prefix.isdigit():
+        return []
+    if prefix.startswith("0"):
+        return [(0, 0)] if prefix == "0" else []
+    lo = hi = int(prefix)
+    ranges = []
+    while lo <= max_id:
+        ranges.append((lo, min(hi, max_id)))
+        lo, hi = lo * 10, hi * 10 + 9
+    return ranges
@@ -1,13 +1,28 @@
 import os
 import time
+import re
 import json
 import logging
-from logging.handlers import RotatingFileHandler
+import threading
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import uuid
+from datetime import timezone
 from pymongo import MongoClient
+from pymongo.errors import ExecutionTimeout
 import pandas as pd
 import streamlit as st
 from bson.objectid import ObjectId
 from dotenv import load_dotenv
+from compact_layout import SHORT_KEYS
+
+# app/shared.py: logging, metrics and caches shared with the MySQL app
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+from shared import (
+    LogIndexes, LookupCache, MetricsRegistry, QueryShapes, RecordCache, SlowQueryLog,
+    emit_event, id_prefix_ranges, log_files, log_gauges, parse_sample, parse_year,
+    parse_year_month, search_logs, start_log_writer, tail_logs,
+)
 
 # Env
 load_dotenv()
@@ -15,6 +30,14 @@ load_dotenv()
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
 DB_NAME = os.getenv("DB_NAME", "sfpl")
 
+# Per-query deadline (ms) and size of the background query pool
+QUERY_TIMEOUT_MS = int(os.getenv("QUERY_TIMEOUT_MS", "30000"))
+QUERY_WORKERS = int(os.getenv("QUERY_WORKERS", "4"))
+
+# Queries slower than this (ms) are logged with their explain("executionStats") plan;
+# failed ones only get the "queryPlanner" plan, so a timed-out query isn't run again
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))
+
 ALLOWED_FIELDS = [
     'Patron_ID', 'Patron_Type_Definition', 'Total_Checkouts', 'Total_Renewals',
     'Age_Range', 'Home_Library_Definition', 'Circulation_Active_Month',
@@ -23,9 +46,35 @@ ALLOWED_FIELDS = [
     'Within_San_Francisco_County'
 ]
 
+# With the loaders' --schema-mode typed, years are stored as SMALLINT/int and
+# the active month as a YYYYMM integer, so they can be range-searched; input
+# is read with parse_year/parse_year_month from app/shared.py
+TEMPORAL_FIELDS = ["Circulation_Active_Month", "Circulation_Active_Year", "Year_Patron_Registered"]
+RANGE_FIELDS = ["Patron_ID", "Total_Checkouts", "Total_Renewals"]
+
+# Fields limited to the values already in the collection, cached for LOOKUP_TTL seconds
+LOOKUP_FIELDS = [
+    "Patron_Type_Definition", "Age_Range",
+    "Home_Library_Definition", "Notice_Preference_Definition"
+]
+LOOKUP_TTL = float(os.getenv("LOOKUP_TTL", "300"))
+
+# Patron documents read by ID are cached (LRU, RECORD_CACHE_SIZE documents
+# for RECORD_CACHE_TTL seconds). RECORD_CACHE_WATCH=1 follows a change
+# stream to drop documents changed elsewhere (replica set only).
+RECORD_CACHE_SIZE = int(os.getenv("RECORD_CACHE_SIZE", "10000"))
+RECORD_CACHE_TTL = float(os.getenv("RECORD_CACHE_TTL", "60"))
+RECORD_CACHE_WATCH = os.getenv("RECORD_CACHE_WATCH", "0") == "1"
+
 # Logs
 LOG_DIR = "logs"
 LOG_FILE = os.path.join(LOG_DIR, "app.log")
+LOG_BACKUPS = 3
+# Events are written by a background thread; LOG_SAMPLE keeps a fraction of
+# info events for busy actions, e.g. LOG_SAMPLE=search=0.1,refresh=0.25
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_BATCH = int(os.getenv("LOG_BATCH", "200"))
+LOG_SAMPLE = parse_sample(os.getenv("LOG_SAMPLE", ""))
 os.makedirs(LOG_DIR, exist_ok=True)
 
 INT_FIELDS = {"Patron_ID", "Total_Checkouts", "Total_Renewals"}
@@ -39,19 +88,41 @@ STRING_FIELDS = {
 logger = logging.getLogger("patron_app")
 logger.setLevel(logging.INFO)
 
-if not any(isinstance(h, RotatingFileHandler) for h in logger.handlers):
-    file_handler = RotatingFileHandler(LOG_FILE, maxBytes=2_000_000, backupCount=3)
-    file_handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(message)s'))
-    logger.addHandler(file_handler)
+start_log_writer(logger, LOG_FILE, LOG_BACKUPS, LOG_QUEUE_SIZE, LOG_BATCH)
 
 def log_event(level: str, action: str, **kwargs):
-    payload = {"action": action}
-    payload.update(kwargs)
-    line = json.dumps(payload, ensure_ascii=False)
-    if level.lower() == "error":
-        logger.error(line)
-    else:
-        logger.info(line)
+    """Queue a JSON log event for the writer thread (LOG_SAMPLE thins out busy info events)."""
+    emit_event(logger, LOG_SAMPLE, level, action, **kwargs)
+
+# shape_id -> query text, kept next to the logs so ids in rotated or
+# dropped log lines can always be looked up
+QUERY_SHAPES_FILE = os.path.join(LOG_DIR, "query_shapes.jsonl")
+
+@st.cache_resource
+def get_query_shapes():
+    return QueryShapes(QUERY_SHAPES_FILE, log_event)
+
+def shape_id(shape):
+    """Short id for a query shape; the full text is kept in QUERY_SHAPES_FILE."""
+    return get_query_shapes().id(shape)
+
+# Log viewer
+LOG_INDEX_DIR = os.path.join(LOG_DIR, ".index")
+
+@st.cache_resource
+def get_log_indexes():
+    return LogIndexes(LOG_INDEX_DIR)
+
+# Metrics
+METRICS_FILE = os.getenv("METRICS_FILE", os.path.join(LOG_DIR, "metrics.prom"))
+METRICS_INTERVAL = float(os.getenv("METRICS_INTERVAL", "15"))
+
+@st.cache_resource
+def get_metrics():
+    metrics = MetricsRegistry("mongodb", METRICS_FILE, log_event)
+    metrics.add_gauges(lambda: log_gauges(logger))
+    metrics.start_writer(METRICS_INTERVAL)
+    return metrics
 
 # Database Pool
 @st.cache_resource
@@ -63,22 +134,530 @@ def get_collection():
     db = get_db()
     return db["patrons"]
 
-def refresh_table():
-    col = get_collection()
+# Document layout
+class DocumentLayout:
+    """
+    Translates between the display field names the app uses and the stored
+    documents. The full layout stores fields under their display names with
+    _id == Patron_ID. The compact layout (loader --layout compact) uses
+    SHORT_KEYS, omits null fields and stores the lookup fields as indexes
+    into the value lists kept in the patron_codes collection. `stale` is set
+    when a stored code is past the end of those lists (values were appended
+    after they were read).
+    """
+
+    def __init__(self, codes=None):
+        self.compact = codes is not None
+        self.codes = codes or {}
+        self._code_of = {f: {v: i for i, v in enumerate(values)} for f, values in self.codes.items()}
+        self.stale = False
+
+    def key(self, field):
+        return SHORT_KEYS.get(field, field) if self.compact else field
+
+    def encode_value(self, field, value):
+        if not self.compact or field not in self._code_of or value is None:
+            return value
+        if value not in self._code_of[field]:
+            raise ValueError(f"'{value}' has no code for {field} in patron_codes.")
+        return self._code_of[field][value]
+
+    def encode(self, doc):
+        """Display document (with Patron_ID) -> document to insert."""
+        if not self.compact:
+            return {"_id": doc["Patron_ID"], **doc}
+        return {self.key(f): self.encode_value(f, v) for f, v in doc.items() if v is not None}
+
+    def decode(self, stored, fields=ALLOWED_FIELDS):
+        """Stored document -> display document with `fields` (missing = None)."""
+        doc = {}
+        for f in fields:
+            v = stored.get(self.key(f))
+            if self.compact and f in self.codes and v is not None:
+                if 0 <= v < len(self.codes[f]):
+                    v = self.codes[f][v]
+                else:
+                    self.stale = True
+                    v = None
+            doc[f] = v
+        return doc
+
+    def filter(self, query):
+        """
+        Display-name filter -> stored filter. Patron_ID is matched on _id (the
+        same value in both layouts, and indexed); $and/$or are translated
+        recursively.
+        """
+        if not query:
+            return query
+        out = {}
+        for f, cond in query.items():
+            if f in ("$and", "$or", "$nor"):
+                out[f] = [self.filter(q) for q in cond]
+            elif f == "Patron_ID":
+                out["_id"] = cond
+            elif f in self._code_of:
+                out[self.key(f)] = self._coded_condition(f, cond)
+            else:
+                out[self.key(f)] = cond
+        return out
+
+    def _coded_condition(self, field, cond):
+        if cond is None:
+            return None
+        if isinstance(cond, dict) and "$regex" in cond:
+            # Match the regex against the code list, then look the codes up
+            try:
+                rx = re.compile(cond["$regex"], re.IGNORECASE if "i" in cond.get("$options", "") else 0)
+            except re.error as e:
+                raise ValueError(f"Invalid pattern: {e}")
+            return {"$in": [i for i, v in enumerate(self.codes[field]) if rx.search(v)]}
+        if isinstance(cond, dict):
+            return {op: self._code_of[field].get(v, -1) for op, v in cond.items()}
+        code = self._code_of[field].get(cond)
+        return code if code is not None else {"$in": []}
+
+    def sort(self, sort):
+        if not sort:
+            return None
+        return ("_id" if sort[0] == "Patron_ID" else self.key(sort[0]), sort[1])
+
+    def projection(self, fields=ALLOWED_FIELDS):
+        """Only the stored keys behind `fields`; _id is left out unless it is one of them."""
+        proj = {self.key(f): 1 for f in fields}
+        proj.setdefault("_id", 0)
+        return proj
+
+    def update(self, field, value):
+        """$set/$unset for one display field."""
+        if field == "Patron_ID":
+            raise ValueError("Patron_ID is the document _id and can't be changed.")
+        key = self.key(field)
+        if value is None:
+            return {"$unset": {key: ""}}
+        return {"$set": {key: self.encode_value(field, value)}}
+
+class LayoutCache:
+    """
+    The current DocumentLayout, shared by all sessions. patron_codes grows
+    while the app runs (the replication worker appends new values), so it is
+    read again after `ttl` seconds, whenever the lookup lists are reloaded,
+    and as soon as a layout meets a code past the end of its lists.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.layout = None
+        self.loaded_at = 0.0
+
+    def _load(self):
+        codes = {d["_id"]: d["values"] for d in get_db()["patron_codes"].find()}
+        self.layout = DocumentLayout(codes or None)
+        self.loaded_at = time.time()
+
+    def get(self):
+        with self._lock:
+            if self.layout is None or time.time() - self.loaded_at > self.ttl:
+                self._load()
+            return self.layout
+
+    def reload(self, seen=None):
+        """Read patron_codes again, unless another caller already replaced `seen`."""
+        with self._lock:
+            if seen is None or self.layout is seen:
+                self._load()
+            return self.layout
+
+@st.cache_resource
+def get_layout_cache():
+    return LayoutCache(LOOKUP_TTL)
+
+def get_layout():
+    return get_layout_cache().get()
+
+def decode_docs(layout, docs, fields=ALLOWED_FIELDS):
+    """Stored documents -> display documents, reloading the layout once if it is missing codes."""
+    out = [layout.decode(d, fields) for d in docs]
+    if layout.stale:
+        layout = get_layout_cache().reload(layout)
+        out = [layout.decode(d, fields) for d in docs]
+    return out
+
+def run_find(col, query=None, sort=None, timeout_ms=QUERY_TIMEOUT_MS, job=None, limit=0,
+             fields=ALLOWED_FIELDS, layout=None):
+    """
+    find() with a server-side max_time_ms deadline.
+    query/sort use display field names and are translated by the layout;
+    only `fields` are fetched (projection) and returned.
+    job: background job dict; its tag is sent as the query comment so the
+    operation can be found in $currentOp and killed
+    """
+    layout = layout or get_layout()
+    query = layout.filter(query)
+    sort = layout.sort(sort)
     t0 = time.time()
+    cursor = col.find(query or {}, layout.projection(fields)).max_time_ms(timeout_ms)
+    if job is not None:
+        cursor = cursor.comment(job["tag"])
+    if sort:
+        cursor = cursor.sort(*sort)
+    if limit:
+        cursor = cursor.limit(limit)
+    try:
+        docs = list(cursor)
+    except Exception as e:
+        dt = time.time() - t0
+        if dt * 1000 >= SLOW_QUERY_MS:
+            capture_slow_query(col, query, sort, dt, None, error=str(e))
+        raise
+    dt = time.time() - t0
+    if dt * 1000 >= SLOW_QUERY_MS:
+        capture_slow_query(col, query, sort, dt, len(docs))
+    return decode_docs(layout, docs, fields), dt
+
+# Slow queries
+@st.cache_resource
+def get_slow_log():
+    return SlowQueryLog()
+
+def filter_shape(value):
+    """Query shape: field names and operators kept, values replaced by ?."""
+    if isinstance(value, dict):
+        return {k: filter_shape(v) for k, v in sorted(value.items())}
+    if isinstance(value, list):
+        return [filter_shape(v) for v in value]
+    return None if value is None else "?"
+
+def summarize_plan(plan):
+    """Stages, index and documents examined from explain("executionStats")."""
+    stages, indexes = [], []
+
+    def walk(node):
+        if isinstance(node, dict):
+            if "stage" in node:
+                stages.append(node["stage"])
+                if node.get("indexName"):
+                    indexes.append(node["indexName"])
+            for v in node.values():
+                walk(v)
+        elif isinstance(node, list):
+            for v in node:
+                walk(v)
+
+    walk(plan.get("queryPlanner", {}).get("winningPlan", {}))
+    stats = plan.get("executionStats", {})
+    return {
+        "access": " > ".join(stages) or None,
+        "index": ", ".join(indexes) or None,
+        "rows_examined": stats.get("totalDocsExamined"),
+        "keys_examined": stats.get("totalKeysExamined"),
+    }
+
+def query_shape(query, sort):
+    shape = f"find {json.dumps(filter_shape(query or {}))}"
+    if sort:
+        shape += f" sort {sort[0]}:{sort[1]}"
+    return shape
+
+def explain_slow_query(col, query, sort, dt, returned, error=None, explain=True):
+    """
+    Record a slow query. explain=False records it without a plan (an explain
+    of the same shape is already running).
+    """
+    shape = query_shape(query, sort)
+    entry = {
+        "ts": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "shape": shape,
+        "params": json.dumps(query or {}, default=str),
+        "elapsed_ms": round(dt * 1000, 1),
+        "rows_returned": returned,
+        "rows_examined": None,
+        "keys_examined": None,
+        "access": None,
+        "index": None,
+        "plan": None,
+        "error": error,
+    }
+    if explain:
+        try:
+            # executionStats runs the query again, so it gets the same deadline;
+            # a query that already failed (timeout, killOp) is only planned
+            cmd = {"find": col.name, "filter": query or {}, "maxTimeMS": QUERY_TIMEOUT_MS}
+            if sort:
+                cmd["sort"] = {sort[0]: sort[1]}
+            verbosity = "queryPlanner" if error else "executionStats"
+            plan = col.database.command("explain", cmd, verbosity=verbosity)
+            entry["plan"] = json.loads(json.dumps(plan, default=str))
+            entry.update(summarize_plan(plan))
+        except Exception as e:
+            entry["error"] = entry["error"] or f"explain failed: {e}"
+        finally:
+            get_slow_log().end_explain(shape)
+    get_slow_log().add(entry)
+    log_event("info", "slow_query", shape_id=shape_id(entry["shape"]),
+              **{k: v for k, v in entry.items() if k not in ("plan", "shape")})
+
+def capture_slow_query(col, query, sort, dt, returned, error=None):
+    """
+    Explain the query on a side thread so the caller gets its result right away.
+    At most one explain per shape runs at a time; the others are recorded without a plan.
+    """
+    if not get_slow_log().begin_explain(query_shape(query, sort)):
+        explain_slow_query(col, query, sort, dt, returned, error, explain=False)
+        return
+    threading.Thread(
+        target=explain_slow_query, args=(col, query, sort, dt, returned, error),
+        name="slow_query_explain", daemon=True,
+    ).start()
+
+# Background queries
+@st.cache_resource
+def get_executor():
+    return ThreadPoolExecutor(max_workers=QUERY_WORKERS, thread_name_prefix="patron_query")
+
+def submit_find(key, query=None, sort=None, timeout_ms=QUERY_TIMEOUT_MS, fields=ALLOWED_FIELDS, **meta):
+    """
+    Run a find on the worker pool and keep the job in the session.
+    The result is picked up on a later rerun once the future is done.
+    fields: columns to fetch and show
+    meta: extra fields for logging when the result is shown
+    """
+    cancel_query(key)
+    job = {
+        "tag": f"patron_app:{key}:{uuid.uuid4().hex}",
+        "started": time.time(),
+        "timeout_ms": timeout_ms,
+        "cancelled": None,
+        "seen": False,
+        "fields": list(fields),
+        "meta": meta,
+    }
+    job["future"] = get_executor().submit(
+        run_find, get_collection(), query, sort, timeout_ms, job, fields=fields, layout=get_layout(),
+    )
+    st.session_state[f"job_{key}"] = job
+    return job
+
+def get_job(key):
+    return st.session_state.get(f"job_{key}")
+
+def job_running(key):
+    job = get_job(key)
+    return job is not None and not job["future"].done()
+
+def cancel_query(key, reason="cancelled"):
+    """Stop a running background find with killOp, matched by its comment."""
+    job = get_job(key)
+    if job is None or job["future"].done():
+        return
+    job["cancelled"] = reason
+    if job["future"].cancel():
+        return
+    try:
+        admin = get_db().client.admin
+        ops = admin.aggregate([
+            {"$currentOp": {}},
+            {"$match": {"command.comment": job["tag"]}},
+        ])
+        for op in ops:
+            admin.command("killOp", op=op["opid"])
+    except Exception as e:
+        log_event("error", "cancel", tag=job["tag"], error=str(e))
+
+def job_error_message(job, e):
+    if job["cancelled"] == "cancelled":
+        return "cancelled"
+    if job["cancelled"] == "timeout" or isinstance(e, ExecutionTimeout):
+        return f"exceeded the {job['timeout_ms'] / 1000:.0f}s limit"
+    return str(e)
+
+@st.fragment(run_every=1)
+def show_job_status(key, label):
+    """Running indicator with a cancel button; reruns the app once the job finishes."""
+    job = get_job(key)
+    if job is None:
+        return
+    if job["future"].done():
+        st.rerun()
+    elapsed = time.time() - job["started"]
+    if elapsed * 1000 > job["timeout_ms"] + 1000:
+        cancel_query(key, reason="timeout")
+    c1, c2 = st.columns([4, 1])
+    with c1:
+        st.info(f"⏳ {label} running for {elapsed:.0f}s...")
+    with c2:
+        if st.button("Cancel", key=f"cancel_{key}"):
+            cancel_query(key)
+            st.rerun()
+
+# Lookup values
+def load_lookups():
+    # The code lists are read again with the lookup lists so both stay in step
+    layout = get_layout_cache().reload()
+    if layout.compact:
+        return {field: sorted(v for v in layout.codes.get(field, []) if v) for field in LOOKUP_FIELDS}
+    col = get_collection()
+    return {field: sorted(v for v in col.distinct(field) if v) for field in LOOKUP_FIELDS}
+
+@st.cache_resource
+def get_lookups():
+    return LookupCache(load_lookups, LOOKUP_TTL)
 
-    docs = list(col.find().sort("Patron_ID", 1))
+def validate_lookups(values):
+    """Check lookup fields against the values already in the collection before writing."""
+    allowed = get_lookups().get()
+    errors = []
+    for field, value in values.items():
+        if value is not None and field in allowed and value not in allowed[field]:
+            errors.append(f"'{value}' is not a known {field}.")
+    return errors
+
+# Typed temporal columns
+@st.cache_resource
+def get_schema_mode():
+    """'typed' if the loader ran with --schema-mode typed (years stored as numbers), else 'text'."""
+    key = get_layout().key("Circulation_Active_Year")
+    doc = get_collection().find_one({key: {"$nin": [None, "", "None"]}}, {key: 1})
+    return "typed" if doc and isinstance(doc[key], int) else "text"
+
+def convert_temporal(field, value, year=None, bound=None):
+    """
+    User input for a temporal field -> the value to store or compare with.
+    Unchanged in the text schema. bound="low"/"high" lets a bare year stand
+    for its first/last month in month ranges. Raises ValueError if unreadable.
+    """
+    if value is None or str(value).strip() == "":
+        return None
+    if get_schema_mode() != "typed":
+        return value
+    if field == "Circulation_Active_Month":
+        y = parse_year(value) if bound else None
+        if y is not None:
+            out = y * 100 + (1 if bound == "low" else 12)
+        else:
+            out = parse_year_month(value, year)
+        hint = "a month like 2022-11 or November 2022"
+    else:
+        out = parse_year(value)
+        hint = "a year like 2016"
+    if out is None:
+        raise ValueError(f"'{value}' is not {hint} for {field}.")
+    return out
+
+def range_fields():
+    return RANGE_FIELDS + (TEMPORAL_FIELDS if get_schema_mode() == "typed" else [])
+
+def range_bounds(field, low, high):
+    """(low, high) for a range search, either may be None; raises ValueError."""
+    def bound(v, which):
+        if v.strip() == "":
+            return None
+        if field in TEMPORAL_FIELDS:
+            return convert_temporal(field, v, bound=which)
+        try:
+            return int(v)
+        except ValueError:
+            raise ValueError(f"'{v}' is not a number for {field}.")
+
+    lo, hi = bound(low, "low"), bound(high, "high")
+    if lo is None and hi is None:
+        raise ValueError("Enter at least one bound.")
+    return lo, hi
+
+def range_filter(field, low, high):
+    """Filter for low <= field <= high, served by the typed loader's indexes."""
+    lo, hi = range_bounds(field, low, high)
+    cond = {}
+    if lo is not None:
+        cond["$gte"] = lo
+    if hi is not None:
+        cond["$lte"] = hi
+    return {field: cond}
+
+# Record cache
+def follow_change_feed(cache):
+    """
+    Invalidate patrons changed outside this app using a change stream
+    (needs a replica set; _id is the Patron_ID). After an error the stream
+    is reopened from its resume token; if it can't be resumed, changes may
+    have been missed and the whole cache is dropped.
+    """
+    resume = None
+    while True:
+        try:
+            with get_collection().watch(resume_after=resume) as stream:
+                resume = stream.resume_token or resume
+                for change in stream:
+                    # drop/rename events have no documentKey: forget everything
+                    cache.invalidate(change.get("documentKey", {}).get("_id"))
+                    resume = stream.resume_token
+        except Exception as e:
+            log_event("error", "record_cache_feed", resumable=resume is not None, error=str(e))
+            # 280 ChangeStreamFatalError, 286 ChangeStreamHistoryLost: the token is unusable
+            if resume is None or getattr(e, "code", None) in (280, 286):
+                resume = None
+                cache.invalidate()
+            time.sleep(5)
+
+@st.cache_resource
+def get_record_cache():
+    cache = RecordCache(RECORD_CACHE_SIZE, RECORD_CACHE_TTL)
+    get_metrics().add_gauges(lambda: {f"record_cache_{k}": v for k, v in cache.metrics().items()})
+    if RECORD_CACHE_WATCH:
+        threading.Thread(target=follow_change_feed, args=(cache,), name="record_cache_feed", daemon=True).start()
+    return cache
+
+def get_patron(patron_id):
+    """
+    One patron by ID through the record cache.
+    Returns (doc or None, seconds, True if served from the cache).
+    """
+    cache = get_record_cache()
+    t0 = time.time()
+    doc = cache.get(patron_id)
+    if doc is not None:
+        return doc, time.time() - t0, True
+    token = cache.token()
+    layout = get_layout()
+    doc = get_collection().find_one(layout.filter({"Patron_ID": patron_id}), layout.projection(), max_time_ms=QUERY_TIMEOUT_MS)
     dt = time.time() - t0
+    if doc is not None:
+        doc = decode_docs(layout, [doc])[0]
+        cache.put(patron_id, doc, token)
+    return doc, dt, False
+
+def find_patron_ids(prefix, limit=10):
+    """Up to `limit` patrons whose ID starts with `prefix`, via range scans on the _id index (_id == Patron_ID)."""
+    ranges = id_prefix_ranges(prefix)
+    if not ranges:
+        return []
+    query = {"$or": [{"_id": {"$gte": lo, "$lte": hi}} for lo, hi in ranges]}
+    docs, _ = run_find(get_collection(), query, sort=("_id", 1), limit=limit)
+    return docs
 
-    st.caption(f"Fetched {len(docs)} row(s) in {dt:.3f}s • Last refresh: {time.strftime('%H:%M:%S')}")
+def patron_picker(label, key):
+    """
+    Typeahead for Patron_ID: one small indexed query for IDs starting with
+    the typed digits, with the selected patron's current fields shown.
+    Returns (patron_id, row) or (None, None).
+    """
+    prefix = st.text_input(f"{label} (type the first digits)", key=f"{key}_prefix").strip()
+    if not prefix:
+        return None, None
+    rows = find_patron_ids(prefix)
+    if not rows:
+        st.warning(f"No patron ID starts with '{prefix}'.")
+        return None, None
+    by_id = {r["Patron_ID"]: r for r in rows}
 
-    if not docs:
-        return pd.DataFrame()
+    def describe(pid):
+        r = by_id[pid]
+        return f"{pid} · {r.get('Patron_Type_Definition') or '-'} · {r.get('Age_Range') or '-'} · {r.get('Home_Library_Definition') or '-'}"
 
-    df = pd.DataFrame(docs)
-    if "_id" in df.columns:
-        df = df.drop(columns=["_id"])
-    return df
+    patron_id = st.selectbox(label, list(by_id), format_func=describe, key=f"{key}_id")
+    st.dataframe(pd.DataFrame([by_id[patron_id]]), use_container_width=True, hide_index=True)
+    return patron_id, by_id[patron_id]
 
 # User Interface
 st.set_page_config(page_title="Patron Manager", layout="wide")
@@ -89,22 +668,47 @@ with st.sidebar:
     st.text(f"URI: {MONGO_URI}")
     st.text(f"Database: {DB_NAME}")
     st.text("Collection: patrons")
+    st.text(f"Layout: {'compact' if get_layout().compact else 'full'}")
+
+    # Written by replicate_mysql_to_mongodb.py run
+    repl = get_db()["replication_state"].find_one({"_id": "mysql_patrons"})
+    if repl:
+        with st.expander("Replication from MySQL"):
+            checked = repl.get("checked_at")
+            age = f"{time.time() - checked.replace(tzinfo=timezone.utc).timestamp():.0f}s ago" if checked else "never"
+            st.caption(
+                f"Change {repl['change_id']} • backlog {repl.get('backlog', '?')} • "
+                f"lag {repl.get('lag_s', 0):.1f}s • {repl.get('rate', 0):,.0f} changes/s • checked {age}"
+            )
+
+    with st.expander("Record cache"):
+        rc = get_record_cache()
+        cm = rc.metrics()
+        st.caption(
+            f"{cm['entries']}/{cm['max_entries']} patrons • {cm['bytes'] / 1024:.0f} KB • "
+            f"hit ratio {cm['hit_ratio']:.0%} ({cm['hits']} hits, {cm['misses']} misses) • "
+            f"{cm['evictions']} evicted • TTL {RECORD_CACHE_TTL:.0f}s"
+        )
+        if st.button("Clear record cache"):
+            rc.invalidate()
 
     st.markdown("---")
     st.subheader("View options")
+    # Only these columns are fetched (projection) for View All
+    view_fields = st.multiselect("Columns", ALLOWED_FIELDS, default=ALLOWED_FIELDS, key="view_fields") or ["Patron_ID"]
 
-tab_view, tab_add, tab_update, tab_search, tab_delete, tab_logs = st.tabs(
-    ["View All", "Add New", "Update", "Search", "Delete", "Logs"]
-)
+# Only the selected section runs, so an interaction costs that section's queries only
+SECTIONS = ["View All", "Add New", "Update", "Search", "Delete", "Logs", "Metrics", "Slow Queries"]
+section = st.radio("Section", SECTIONS, horizontal=True, key="section", label_visibility="collapsed")
 
 # View
-with tab_view:
+if section == "View All":
     st.subheader("All patrons")
 
     c1, c2, c3 = st.columns([1, 1, 2])
     with c1:
         if st.button("🔄 Refresh now"):
-            st.rerun()
+            submit_find("view", sort=("Patron_ID", 1), fields=view_fields)
 
     default_auto = st.session_state.get("auto_refresh", False)
     default_interval = st.session_state.get("auto_interval", 5)
@@ -114,10 +718,8 @@ with tab_view:
     with c3:
         interval = st.slider("Interval (sec)", min_value=2, max_value=60, value=default_interval, key="auto_interval")
 
-    df = refresh_table()
-    st.dataframe(df, use_container_width=True)
-
     # Auto-refresh
+    due = get_job("view") is None or get_job("view")["fields"] != view_fields
     if auto:
         if "last_refresh_ts" not in st.session_state:
             st.session_state.last_refresh_ts = time.time()
@@ -130,26 +732,53 @@ with tab_view:
 
         if elapsed >= interval:
             st.session_state.last_refresh_ts = time.time()
-            st.rerun()
-        else:
-            time.sleep(1)
-            st.rerun()
+            due = True
+
+    if due and not job_running("view"):
+        submit_find("view", sort=("Patron_ID", 1), fields=view_fields)
+
+    job = get_job("view")
+    if job_running("view"):
+        show_job_status("view", "Loading patrons")
+    else:
+        try:
+            docs, dt = job["future"].result()
+            if not job["seen"]:
+                get_metrics().observe("refresh", dt)
+                job["seen"] = True
+            st.caption(f"Fetched {len(docs)} row(s) in {dt:.3f}s • Last refresh: {time.strftime('%H:%M:%S', time.localtime(job['started']))}")
+            st.dataframe(pd.DataFrame(docs, columns=job["fields"]), use_container_width=True)
+        except Exception as e:
+            st.error(f"Load failed: {job_error_message(job, e)}")
+
+    if auto and not job_running("view"):
+        time.sleep(1)
+        st.rerun()
 
 # Add New
-with tab_add:
+if section == "Add New":
     st.subheader("Add new patron")
+    lookup_cache = get_lookups()
+    lookups = lookup_cache.get()
+    c1, c2 = st.columns([4, 1])
+    with c1:
+        st.caption(f"Dropdown values: lookup lists v{lookup_cache.version}, loaded {time.strftime('%H:%M:%S', time.localtime(lookup_cache.loaded_at))}")
+    with c2:
+        if st.button("Reload lists"):
+            lookup_cache.invalidate()
+            st.rerun()
     with st.form("add_patron"):
         c1, c2, c3 = st.columns(3)
         with c1:
-            patron_type = st.text_input("Patron_Type_Definition")
+            patron_type = st.selectbox("Patron_Type_Definition", lookups["Patron_Type_Definition"], index=None, placeholder="(none)")
             total_checkouts = st.number_input("Total_Checkouts", step=1, format="%d", placeholder="0")
             total_renewals = st.number_input("Total_Renewals", step=1, format="%d", placeholder="0")
-            age_range = st.text_input("Age_Range")
+            age_range = st.selectbox("Age_Range", lookups["Age_Range"], index=None, placeholder="(none)")
         with c2:
-            home_lib = st.text_input("Home_Library_Definition")
+            home_lib = st.selectbox("Home_Library_Definition", lookups["Home_Library_Definition"], index=None, placeholder="(none)")
             circ_month = st.text_input("Circulation_Active_Month")
             circ_year = st.text_input("Circulation_Active_Year")
-            notice_pref = st.text_input("Notice_Preference_Definition")
+            notice_pref = st.selectbox("Notice_Preference_Definition", lookups["Notice_Preference_Definition"], index=None, placeholder="(none)")
         with c3:
             provided_email = st.toggle("Provided_Email_Address (bool / nullable)", value=False)
             provided_email_null = st.checkbox("Set Provided_Email_Address = NULL", value=False)
@@ -159,13 +788,27 @@ with tab_add:
 
         submitted = st.form_submit_button("Insert")
         if submitted:
+            errors = []
+            try:
+                circ_year = convert_temporal("Circulation_Active_Year", circ_year)
+                circ_month = convert_temporal("Circulation_Active_Month", circ_month, circ_year)
+                year_reg = convert_temporal("Year_Patron_Registered", year_reg)
+            except ValueError as e:
+                errors.append(str(e))
+            errors += validate_lookups(dict(zip(LOOKUP_FIELDS, (patron_type, age_range, home_lib, notice_pref))))
+            if errors:
+                log_event("info", "insert", status="invalid", errors=errors)
+                get_metrics().observe("insert", status="invalid")
+                for msg in errors:
+                    st.error(msg)
+                st.stop()
             try:
                 col = get_collection()
-                last = col.find_one(sort=[("Patron_ID", -1)])
-                next_id = (last.get("Patron_ID", 0) + 1) if last else 1
+                layout = get_layout()
+                last = col.find_one(sort=[("_id", -1)], projection={"_id": 1})
+                next_id = (last["_id"] + 1) if last else 1
 
                 doc = {
-                    "_id": next_id,
                     "Patron_ID": next_id,
                     "Patron_Type_Definition": patron_type or None,
                     "Total_Checkouts": int(total_checkouts) if total_checkouts is not None else None,
@@ -181,27 +824,31 @@ with tab_add:
                 }
 
                 t0 = time.time()
-                col.insert_one(doc)
+                col.insert_one(layout.encode(doc))
                 dt = time.time() - t0
 
-                log_event("info", "insert", status="ok", elapsed=f"{dt:.3f}s", values=doc)
+                log_event("info", "insert", status="ok", elapsed_ms=round(dt * 1000, 1), values=doc)
+                get_metrics().observe("insert", dt)
                 st.success(f"Inserted new patron in {dt:.3f}s")
+                st.session_state.pop("job_view", None)
                 st.rerun()
 
             except Exception as e:
                 log_event("error", "insert", status="fail", error=str(e))
+                get_metrics().observe("insert", status="fail")
                 st.error(f"Insert failed: {e}")
 
 # Update
-with tab_update:
+if section == "Update":
     st.subheader("Update a field")
-    df_now = refresh_table()
-    id_list = df_now["Patron_ID"].tolist() if "Patron_ID" in df_now else []
-    patron_id = st.selectbox("Patron_ID", id_list) if id_list else st.number_input("Patron_ID", step=1)
+    patron_id, current = patron_picker("Patron_ID", key="update")
     field = st.selectbox("Field", ALLOWED_FIELDS, index=1)
-    new_val = st.text_input("New value (leave blank for NULL)")
+    if field in LOOKUP_FIELDS:
+        new_val = st.selectbox("New value", get_lookups().get()[field], index=None, placeholder="(NULL)") or ""
+    else:
+        new_val = st.text_input("New value (leave blank for NULL)")
 
-    if st.button("Update"):
+    if st.button("Update", disabled=patron_id is None):
         try:
             if field not in ALLOWED_FIELDS:
                 st.error("Invalid field.")
@@ -209,6 +856,19 @@ with tab_update:
 
             val = None if new_val.strip() == "" else new_val.strip()
 
+            if field in LOOKUP_FIELDS:
+                errors = validate_lookups({field: val})
+                if errors:
+                    st.error(" ".join(errors))
+                    st.stop()
+
+            if field in TEMPORAL_FIELDS:
+                try:
+                    val = convert_temporal(field, val, current and current.get("Circulation_Active_Year"))
+                except ValueError as e:
+                    st.error(str(e))
+                    st.stop()
+
             if field in ["Total_Checkouts", "Total_Renewals"] and val is not None:
                 val = int(val)
 
@@ -225,129 +885,258 @@ with tab_update:
             patron_id = int(patron_id)
             t0 = time.time()
 
-            if val is None:
-                col.update_one({"Patron_ID": patron_id}, {"$unset": {field: ""}})
-            else:
-                col.update_one({"Patron_ID": patron_id}, {"$set": {field: val}})
+            layout = get_layout()
+            try:
+                col.update_one(layout.filter({"Patron_ID": patron_id}), layout.update(field, val))
+            finally:
+                get_record_cache().invalidate(patron_id)
 
             dt = time.time() - t0
-            log_event("info", "update", status="ok", patron_id=patron_id, field=field, value=val, elapsed=f"{dt:.3f}s")
+            log_event("info", "update", status="ok", patron_id=patron_id, field=field, value=val, elapsed_ms=round(dt * 1000, 1))
+            get_metrics().observe("update", dt)
             st.success(f"Updated Patron {patron_id} ({field}) in {dt:.3f}s")
+            st.session_state.pop("job_view", None)
             st.rerun()
 
         except Exception as e:
             log_event("error", "update", status="fail", patron_id=patron_id, field=field, value=new_val, error=str(e))
+            get_metrics().observe("update", status="fail")
             st.error(f"Update failed: {e}")
 
 # Search
-with tab_search:
+if section == "Search":
     st.subheader("Search patrons")
     col1, col2, col3 = st.columns([1, 1, 1])
     with col1:
         field = st.selectbox("Field", ALLOWED_FIELDS)
     with col2:
-        mode = st.radio("Match type", ["exact", "like"], horizontal=True, index=0)
+        mode = st.radio("Match type", ["exact", "like", "range"], horizontal=True, index=0)
     with col3:
         null_search = st.checkbox("Find rows where value IS NULL")
 
-    value = st.text_input("Value (ignored if 'IS NULL' is checked)")
+    if mode == "range":
+        r1, r2 = st.columns(2)
+        with r1:
+            low = st.text_input("From (blank for no lower bound)")
+        with r2:
+            high = st.text_input("To (blank for no upper bound)")
+        value = f"{low}..{high}"
+        if field in TEMPORAL_FIELDS:
+            st.caption("Years like 2016; months like 2022-11 (a year alone means its first/last month).")
+    else:
+        value = st.text_input("Value (ignored if 'IS NULL' is checked)")
 
     if st.button("Run search"):
-        try:
-            col = get_collection()
-            t0 = time.time()
-            query = {}
-
-            if null_search:
-                query = {field: None}
+        st.session_state.pop("search_by_id", None)
+        query = None
+        if null_search:
+            query = {field: None}
+        else:
+            raw_val = value.strip()
+            if mode == "like":
+                if field not in STRING_FIELDS:
+                    st.error("LIKE search is only supported for text fields.")
+                    st.stop()
+                query = {field: {"$regex": raw_val, "$options": "i"}}
+            elif mode == "range":
+                if field not in range_fields():
+                    st.error(f"Range search on {field} needs the typed schema (load with --schema-mode typed).")
+                    st.stop()
+                try:
+                    query = range_filter(field, low, high)
+                except ValueError as e:
+                    st.error(str(e))
+                    st.stop()
             else:
-                raw_val = value.strip()
-                if mode == "like":
-                    if field not in STRING_FIELDS:
-                        st.error("LIKE search is only supported for text fields.")
+                qval = raw_val
+                if field in INT_FIELDS:
+                    try:
+                        qval = int(raw_val)
+                    except ValueError:
+                        st.error(f"Value '{raw_val}' is not a valid integer for {field}.")
+                        st.stop()
+                if field in TEMPORAL_FIELDS:
+                    try:
+                        qval = convert_temporal(field, raw_val)
+                    except ValueError as e:
+                        st.error(str(e))
+                        st.stop()
+                if field in BOOL_FIELDS:
+                    v = raw_val.lower()
+                    if v in ["true", "t", "1", "yes"]:
+                        qval = True
+                    elif v in ["false", "f", "0", "no"]:
+                        qval = False
+                    else:
+                        st.error(f"Value '{raw_val}' is not a valid boolean. Use true/false, yes/no, 1/0.")
                         st.stop()
-                    query = {field: {"$regex": raw_val, "$options": "i"}}
-                else:
-                    qval = raw_val
-                    if field in INT_FIELDS:
-                        try:
-                            qval = int(raw_val)
-                        except ValueError:
-                            st.error(f"Value '{raw_val}' is not a valid integer for {field}.")
-                            st.stop()
-                    if field in BOOL_FIELDS:
-                        v = raw_val.lower()
-                        if v in ["true", "t", "1", "yes"]:
-                            qval = True
-                        elif v in ["false", "f", "0", "no"]:
-                            qval = False
-                        else:
-                            st.error(f"Value '{raw_val}' is not a valid boolean. Use true/false, yes/no, 1/0.")
-                            st.stop()
-
-                    query = {field: qval}
-
-            docs = list(col.find(query))
-            dt = time.time() - t0
 
-            for d in docs:
-                d["_id"] = str(d["_id"])
+                query = {field: qval}
 
-            log_event("info", "search", mode=mode, field=field, value=value,
-                      results=len(docs), elapsed=f"{dt:.3f}s")
-            st.caption(f"Query in {dt:.3f}s • Last refresh: {time.strftime('%H:%M:%S')}")
-            st.dataframe(pd.DataFrame(docs), use_container_width=True)
+        if field == "Patron_ID" and mode == "exact" and not null_search:
+            # Point lookup: served from the record cache when possible
+            st.session_state.pop("job_search", None)
+            try:
+                doc, dt, hit = get_patron(query[field])
+                log_event("info", "search", mode=mode, field=field, value=value, results=int(doc is not None),
+                          cache="hit" if hit else "miss", elapsed_ms=round(dt * 1000, 1))
+                get_metrics().observe("search", dt)
+                st.session_state["search_by_id"] = {"docs": [doc] if doc else [], "dt": dt, "hit": hit, "started": time.time()}
+            except Exception as e:
+                log_event("error", "search", mode=mode, field=field, value=value, error=str(e))
+                get_metrics().observe("search", status="fail")
+                st.error(f"Search failed: {e}")
+        else:
+            submit_find("search", query, mode=mode, field=field, value=value)
 
+    point = st.session_state.get("search_by_id")
+    job = get_job("search")
+    if point is not None:
+        source = "record cache" if point["hit"] else "database"
+        st.caption(f"Lookup in {point['dt']:.3f}s from the {source} • Last refresh: {time.strftime('%H:%M:%S', time.localtime(point['started']))}")
+        st.dataframe(pd.DataFrame(point["docs"]), use_container_width=True)
+    elif job_running("search"):
+        show_job_status("search", "Search")
+    elif job is not None:
+        try:
+            docs, dt = job["future"].result()
+            if not job["seen"]:
+                log_event("info", "search", **job["meta"], results=len(docs), elapsed_ms=round(dt * 1000, 1))
+                get_metrics().observe("search", dt)
+            st.caption(f"Query in {dt:.3f}s • Last refresh: {time.strftime('%H:%M:%S', time.localtime(job['started']))}")
+            st.dataframe(pd.DataFrame(docs), use_container_width=True)
         except Exception as e:
-            log_event("error", "search", mode=mode, field=field, value=value, error=str(e))
-            st.error(f"Search failed: {e}")
+            msg = job_error_message(job, e)
+            if not job["seen"]:
+                log_event("error", "search", **job["meta"], error=msg)
+                get_metrics().observe("search", status=job["cancelled"] or "fail")
+            st.error(f"Search failed: {msg}")
+        job["seen"] = True
 
 # Delete
-with tab_delete:
+if section == "Delete":
     st.subheader("Delete patron")
-    df_now = refresh_table()
-    id_list = df_now["Patron_ID"].tolist() if "Patron_ID" in df_now else []
-    if id_list:
-        del_id = st.selectbox("Patron_ID to delete", id_list, key="delete_select_id")
-    else:
-        del_id = st.number_input("Patron_ID", step=1, key="delete_number_id")
+    del_id, _ = patron_picker("Patron_ID to delete", key="delete")
 
-    if st.button("Delete", type="primary"):
+    if st.button("Delete", type="primary", disabled=del_id is None):
         try:
             col = get_collection()
             del_id = int(del_id)
             t0 = time.time()
-            existing = col.find_one({"Patron_ID": del_id})
+            existing, _, _ = get_patron(del_id)
             if not existing:
                 st.error(f"No patron with ID {del_id} found.")
                 log_event("info", "delete", status="not_found", patron_id=del_id)
+                get_metrics().observe("delete", status="not_found")
             else:
-                col.delete_one({"Patron_ID": del_id})
+                try:
+                    result = col.delete_one(get_layout().filter({"Patron_ID": del_id}))
+                finally:
+                    get_record_cache().invalidate(del_id)
                 dt = time.time() - t0
-                log_event("info", "delete", status="ok", patron_id=del_id, elapsed=f"{dt:.3f}s")
-                st.success(f"Deleted Patron {del_id} in {dt:.3f}s")
-                st.rerun()
+                # The cached document can be up to RECORD_CACHE_TTL old; someone else may have deleted it
+                if result.deleted_count == 0:
+                    st.error(f"No patron with ID {del_id} found.")
+                    log_event("info", "delete", status="not_found", patron_id=del_id, elapsed_ms=round(dt * 1000, 1))
+                    get_metrics().observe("delete", dt, status="not_found")
+                else:
+                    log_event("info", "delete", status="ok", patron_id=del_id, elapsed_ms=round(dt * 1000, 1))
+                    get_metrics().observe("delete", dt)
+                    st.success(f"Deleted Patron {del_id} in {dt:.3f}s")
+                    st.session_state.pop("job_view", None)
+                    st.rerun()
         except Exception as e:
             log_event("error", "delete", status="fail", patron_id=del_id, error=str(e))
+            get_metrics().observe("delete", status="fail")
             st.error(f"Delete failed: {e}")
 
 # Logs
-with tab_logs:
+if section == "Logs":
     st.subheader("Application logs")
     colA, colB = st.columns([1, 3])
     with colA:
         max_lines = st.number_input("Show last N lines", min_value=10, max_value=10000, value=500, step=10)
+        files = log_files(LOG_FILE, LOG_BACKUPS)
+        indexes = get_log_indexes().current(files)
+        actions = sorted(set().union(*(idx["actions"] for _, idx in indexes)))
+        statuses = sorted(set().union(*(idx["statuses"] for _, idx in indexes)))
+        f_action = st.selectbox("Action", ["(any)"] + actions)
+        f_status = st.selectbox("Status", ["(any)"] + statuses)
+        f_level = st.selectbox("Level", ["(any)", "INFO", "ERROR"])
+        windows = {"any time": None, "last 15 minutes": 900, "last hour": 3600, "last 24 hours": 86400, "last 7 days": 604800}
+        f_window = st.selectbox("Time", list(windows))
         if st.button("Refresh logs"):
             st.rerun()
     with colB:
         if os.path.exists(LOG_FILE):
-            def tail(path, n=500):
-                with open(path, "r", encoding="utf-8", errors="ignore") as f:
-                    lines = f.readlines()
-                return "".join(lines[-n:])
-            content = tail(LOG_FILE, int(max_lines))
-            st.code(content or "(no log content yet)", language="text")
+            filtered = f_action != "(any)" or f_status != "(any)" or f_level != "(any)" or windows[f_window]
+            if filtered:
+                lines = search_logs(
+                    indexes,
+                    action=None if f_action == "(any)" else f_action,
+                    status=None if f_status == "(any)" else f_status,
+                    level=None if f_level == "(any)" else f_level,
+                    since=time.time() - windows[f_window] if windows[f_window] else None,
+                    limit=int(max_lines),
+                )
+                st.caption(f"{len(lines)} matching line(s), newest first")
+            else:
+                lines = tail_logs(files, int(max_lines))
+            st.code("\n".join(lines) or "(no log content yet)", language="text")
             with open(LOG_FILE, "rb") as f:
                 st.download_button("Download app.log", f, file_name="app.log", mime="text/plain")
         else:
             st.info("No logs yet. Perform an action (add/update/delete) to generate logs.")
+
+# Metrics
+if section == "Metrics":
+    st.subheader("Latency metrics")
+    metrics = get_metrics()
+    rows = metrics.snapshot()
+    if rows:
+        mdf = pd.DataFrame(rows)
+        st.dataframe(mdf.round(2), use_container_width=True)
+        timed = mdf[mdf["status"] == "ok"].dropna(subset=["p95_ms"])
+        if not timed.empty:
+            st.bar_chart(timed.set_index("action")[["p50_ms", "p95_ms", "p99_ms"]])
+    else:
+        st.info("No operations recorded yet. Perform an action to collect metrics.")
+
+    gauges = metrics.gauges()
+    if gauges:
+        st.json(gauges)
+
+    st.caption(f"Written to {METRICS_FILE} every {METRICS_INTERVAL:.0f}s (counts reset when the app restarts).")
+    if st.button("Write metrics now"):
+        metrics.write()
+        st.success(f"Wrote {METRICS_FILE}")
+
+# Slow Queries
+if section == "Slow Queries":
+    st.subheader("Slow queries")
+    st.caption(f"Queries slower than {SLOW_QUERY_MS:.0f} ms (SLOW_QUERY_MS) since the app started, grouped by query shape.")
+    entries = get_slow_log().entries()
+    if entries:
+        sdf = pd.DataFrame(entries)
+        groups = sdf.groupby("shape").agg(
+            count=("elapsed_ms", "size"),
+            avg_ms=("elapsed_ms", "mean"),
+            max_ms=("elapsed_ms", "max"),
+            docs_examined=("rows_examined", "max"),
+            keys_examined=("keys_examined", "max"),
+            returned=("rows_returned", "max"),
+            stages=("access", "last"),
+            index=("index", "last"),
+            last_seen=("ts", "last"),
+        ).sort_values("max_ms", ascending=False)
+        st.dataframe(groups.reset_index().round(1), use_container_width=True)
+
+        shape = st.selectbox("Show latest plan for", groups.index.tolist())
+        latest = sdf[sdf["shape"] == shape].iloc[-1]
+        st.code(f"{shape}\nfilter: {latest['params']}", language="json")
+        if latest["error"]:
+            st.warning(latest["error"])
+        if latest["plan"] is not None:
+            st.json(latest["plan"], expanded=False)
+    else:
+        st.info("No slow queries recorded yet.")
@@ -0,0 +1,27 @@
+"""
+Field names of the compact document layout (load_table_to_mongodb.py
+--layout compact). Shared by the loader, the app and the replication worker
+so they all read and write the same keys.
+"""
+
+# Stored key of every field; Patron_ID is the _id
+SHORT_KEYS = {
+    "Patron_ID": "_id",
+    "Patron_Type_Code": "tc",
+    "Patron_Type_Definition": "pt",
+    "Total_Checkouts": "co",
+    "Total_Renewals": "rn",
+    "Age_Range": "ar",
+    "Home_Library_Code": "lc",
+    "Home_Library_Definition": "hl",
+    "Circulation_Active_Month": "am",
+    "Circulation_Active_Year": "ay",
+    "Notification_Preference_Code": "nc",
+    "Notice_Preference_Definition": "np",
+    "Provided_Email_Address": "em",
+    "Within_San_Francisco_County": "sf",
+    "Year_Patron_Registered": "yr",
+}
+
+# Categorical fields stored as an index into their list in patron_codes
+CODED_FIELDS = ["Patron_Type_Definition", "Age_Range", "Home_Library_Definition", "Notice_Preference_Definition"]
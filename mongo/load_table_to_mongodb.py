@@ -3,8 +3,17 @@ from pymongo import MongoClient
 import argparse
 import time
 
+# --layout compact: short keys, empty fields left out, _id is the Patron_ID
+# and CODED_FIELDS are stored as integer codes listed in patron_codes
+from compact_layout import SHORT_KEYS, CODED_FIELDS
+
 CSV_FILE = "SFPL_DataSF_library-usage_Jan_2023.csv"
 
+# Same month/year parsing as scripts/load_table_to_mysql.py, which is the
+# source of truth for the typed encoding; keep the copies in sync
+MONTHS = ["january", "february", "march", "april", "may", "june", "july",
+          "august", "september", "october", "november", "december"]
+
 def parse_bool(value):
     if value is None:
         return None
@@ -15,15 +24,49 @@ def parse_bool(value):
         return False
     return None
 
+def parse_year(value):
+    """'2016' -> 2016; 'None', '' or anything else -> None."""
+    v = (value or "").strip()
+    return int(v) if v.isdigit() and 1800 <= int(v) <= 2200 else None
+
+def parse_year_month(month, year):
+    """Month name/abbreviation/number and a year -> YYYYMM integer (or None)."""
+    m = (month or "").strip().lower()
+    if m.isdigit() and 1 <= int(m) <= 12:
+        n = int(m)
+    else:
+        n = next((i + 1 for i, name in enumerate(MONTHS) if len(m) >= 3 and name.startswith(m)), None)
+    if n is None or year is None:
+        return None
+    return year * 100 + n
+
+def compact(doc, codes):
+    """Full document -> compact layout; new categorical values get the next code."""
+    out = {}
+    for field, value in doc.items():
+        if field == "_id" or value is None or value == "":
+            continue
+        if field in codes:
+            value = codes[field].setdefault(value, len(codes[field]))
+        out[SHORT_KEYS[field]] = value
+    return out
+
 parser = argparse.ArgumentParser(description="Load CSV into MongoDB")
 parser.add_argument("--file", "-f", default=CSV_FILE)
+parser.add_argument("--uri", default="mongodb://localhost:27017/", help="MongoDB URI")
 parser.add_argument("--schema", default="sfpl", help="MongoDB database name")
+parser.add_argument("--schema-mode", choices=["text", "typed"], default="text",
+                    help="typed: integer years and YYYYMM month, indexed for range queries")
+parser.add_argument("--layout", choices=["full", "compact"], default="full",
+                    help="compact: short keys, no empty fields, integer codes for categorical fields")
 args = parser.parse_args()
 
 CSV_FILE = args.file
 DB_SCHEMA = args.schema
+TYPED = args.schema_mode == "typed"
+COMPACT = args.layout == "compact"
 
-client = MongoClient("mongodb://localhost:27017/")
+client = MongoClient(args.uri)
 db = client[DB_SCHEMA]
 collection = db["patrons"]
 
@@ -32,6 +75,7 @@ print("Connected to MongoDB")
 start_time = time.time()
 
 documents = []
+codes = {field: {} for field in CODED_FIELDS}
 
 with open(CSV_FILE, newline='', encoding='utf-8') as f:
     reader = csv.reader(f)
@@ -59,6 +103,12 @@ with open(CSV_FILE, newline='', encoding='utf-8') as f:
         except:
             total_renewals = None
 
+        circ_month, circ_year, year_reg = g(7), g(8), g(13)
+        if TYPED:
+            circ_year = parse_year(circ_year)
+            circ_month = parse_year_month(circ_month, circ_year)
+            year_reg = parse_year(year_reg)
+
         doc_id = len(documents) + 1
         doc = {
             "_id": doc_id,
@@ -70,17 +120,35 @@ with open(CSV_FILE, newline='', encoding='utf-8') as f:
             "Age_Range": g(4),
             "Home_Library_Code": g(5),
             "Home_Library_Definition": g(6),
-            "Circulation_Active_Month": g(7),
-            "Circulation_Active_Year": g(8),
+            "Circulation_Active_Month": circ_month,
+            "Circulation_Active_Year": circ_year,
             "Notification_Preference_Code": g(9),
             "Notice_Preference_Definition": g(10),
             "Provided_Email_Address": parse_bool(g(11)),
             "Within_San_Francisco_County": parse_bool(g(12)),
-            "Year_Patron_Registered": g(13)
+            "Year_Patron_Registered": year_reg
         }
-        documents.append(doc)
+        documents.append(compact(doc, codes) if COMPACT else doc)
 
 collection.insert_many(documents)
 
+# The app reads the layout from this collection: no code lists means the full layout
+db["patron_codes"].drop()
+if COMPACT:
+    db["patron_codes"].insert_many([{"_id": field, "values": list(values)} for field, values in codes.items()])
+
+if TYPED:
+    # MongoDB has no table partitioning; indexes give the range queries their bounds
+    for field in ("Circulation_Active_Month", "Circulation_Active_Year", "Year_Patron_Registered"):
+        collection.create_index(SHORT_KEYS[field] if COMPACT else field)
+
 end_time = time.time()
 print(f"MongoDB insert complete in {end_time - start_time:.3f} seconds")
+
+# Uncompressed data size is what has to fit in the WiredTiger cache (working set)
+stats = next(collection.aggregate([{"$collStats": {"storageStats": {}}}]))["storageStats"]
+print(
+    f"{args.layout} layout: {stats['count']} documents, avg {stats.get('avgObjSize', 0)} bytes, "
+    f"data {stats['size'] / 1e6:.1f} MB uncompressed, storage {stats['storageSize'] / 1e6:.1f} MB, "
+    f"indexes {stats['totalIndexSize'] / 1e6:.1f} MB"
+)
@@ -0,0 +1,280 @@
+import sys
+import time
+import argparse
+import getpass
+from datetime import datetime, timezone
+
+import mysql.connector
+from pymongo import MongoClient, ReplaceOne, DeleteOne
+from pymongo.errors import PyMongoError
+
+from compact_layout import SHORT_KEYS, CODED_FIELDS
+
+CHANGES_TABLE = "PATRONS_CHANGES"
+STATE_ID = "mysql_patrons"
+
+# Triggers only record which patron changed; the worker reads the current row
+# when it applies the change, so applying the same change twice is harmless
+TRIGGERS = {
+    "patrons_changes_ins": f"""
+    CREATE TRIGGER patrons_changes_ins AFTER INSERT ON PATRONS FOR EACH ROW
+        INSERT INTO {CHANGES_TABLE} (Patron_ID, Op) VALUES (NEW.Patron_ID, 'I')
+    """,
+    "patrons_changes_upd": f"""
+    CREATE TRIGGER patrons_changes_upd AFTER UPDATE ON PATRONS FOR EACH ROW
+    BEGIN
+        INSERT INTO {CHANGES_TABLE} (Patron_ID, Op) VALUES (NEW.Patron_ID, 'U');
+        IF NEW.Patron_ID <> OLD.Patron_ID THEN
+            INSERT INTO {CHANGES_TABLE} (Patron_ID, Op) VALUES (OLD.Patron_ID, 'D');
+        END IF;
+    END
+    """,
+    "patrons_changes_del": f"""
+    CREATE TRIGGER patrons_changes_del AFTER DELETE ON PATRONS FOR EACH ROW
+        INSERT INTO {CHANGES_TABLE} (Patron_ID, Op) VALUES (OLD.Patron_ID, 'D')
+    """,
+}
+
+BOOL_FIELDS = ("Provided_Email_Address", "Within_San_Francisco_County")
+
+def connect_mysql(a):
+    # autocommit so every poll sees the changes committed since the last one
+    return mysql.connector.connect(
+        host=a.host, port=a.port, user=a.user, password=a.password,
+        database=a.schema, autocommit=True,
+    )
+
+def setup(conn, db):
+    """Create the change-log table and triggers, and start the checkpoint at the current end of the log."""
+    cur = conn.cursor()
+    cur.execute(f"""
+    CREATE TABLE IF NOT EXISTS {CHANGES_TABLE} (
+        Change_ID BIGINT AUTO_INCREMENT PRIMARY KEY,
+        Patron_ID INT NOT NULL,
+        Op CHAR(1) NOT NULL,          -- I, U, D, or S (resync)
+        Changed_At TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+        KEY idx_changed_at (Changed_At)
+    )
+    """)
+    for name, ddl in TRIGGERS.items():
+        cur.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cur.execute(ddl)
+    cur.execute(f"SELECT COALESCE(MAX(Change_ID), 0) FROM {CHANGES_TABLE}")
+    start = cur.fetchone()[0]
+    cur.close()
+    # Keep an existing checkpoint so running setup again doesn't skip changes
+    db["replication_state"].update_one(
+        {"_id": STATE_ID},
+        {"$setOnInsert": {"change_id": start, "applied": 0, "created_at": datetime.now(timezone.utc)}},
+        upsert=True,
+    )
+    return start
+
+def resync(conn):
+    """Queue every patron, so the worker copies the whole table without a reload from the CSV."""
+    cur = conn.cursor()
+    cur.execute(f"INSERT INTO {CHANGES_TABLE} (Patron_ID, Op) SELECT Patron_ID, 'S' FROM PATRONS")
+    n = cur.rowcount
+    cur.close()
+    return n
+
+def load_codes(db):
+    """Code lists of the compact layout, or None for the full layout."""
+    codes = {d["_id"]: d["values"] for d in db["patron_codes"].find()}
+    return codes or None
+
+def to_document(row, codes, db):
+    """
+    MySQL row -> document in the collection's layout. Unknown categorical
+    values in the compact layout are appended to patron_codes first.
+    """
+    doc = {}
+    for field, value in row.items():
+        if field in BOOL_FIELDS and value is not None:
+            value = bool(value)
+        doc[field] = value
+    if codes is None:
+        return {"_id": row["Patron_ID"], **doc}
+
+    out = {}
+    for field, value in doc.items():
+        if value is None or value == "" or field not in SHORT_KEYS:
+            continue
+        if field in CODED_FIELDS:
+            values = codes.setdefault(field, [])
+            if value not in values:
+                db["patron_codes"].update_one({"_id": field}, {"$push": {"values": value}}, upsert=True)
+                values.append(value)
+            value = values.index(value)
+        out[SHORT_KEYS[field]] = value
+    return out
+
+def ready_changes(rows, last, gaps, gap_timeout):
+    """
+    The leading run of changes without holes after `last`. A hole can be a
+    transaction that took its Change_ID but hasn't committed yet, so it is
+    waited for up to gap_timeout seconds before being treated as rolled back.
+    """
+    ready = []
+    expected = last + 1
+    now = time.monotonic()
+    for r in rows:
+        if r["Change_ID"] != expected:
+            if now - gaps.setdefault(expected, now) < gap_timeout:
+                break
+            gaps.pop(expected, None)
+        ready.append(r)
+        expected = r["Change_ID"] + 1
+    for k in [k for k in gaps if k < expected]:
+        del gaps[k]
+    return ready
+
+def apply_changes(cur, col, db, codes, changes):
+    """
+    Copy the current state of every changed patron: replace (upsert) if the
+    row exists, delete if it doesn't. Returns the number of patrons written.
+    """
+    ids = list(dict.fromkeys(c["Patron_ID"] for c in changes))
+    rows = {}
+    for i in range(0, len(ids), 1000):
+        chunk = ids[i:i + 1000]
+        cur.execute(f"SELECT * FROM PATRONS WHERE Patron_ID IN ({','.join(['%s'] * len(chunk))})", chunk)
+        rows.update((r["Patron_ID"], r) for r in cur.fetchall())
+    ops = [
+        ReplaceOne({"_id": pid}, to_document(rows[pid], codes, db), upsert=True) if pid in rows
+        else DeleteOne({"_id": pid})
+        for pid in ids
+    ]
+    if ops:
+        col.bulk_write(ops, ordered=False)
+    return len(ops)
+
+def measure_lag(cur, last):
+    """(pending changes, seconds since the oldest pending change was made), on the MySQL clock."""
+    cur.execute(
+        f"SELECT COUNT(*) AS backlog, TIMESTAMPDIFF(MICROSECOND, MIN(Changed_At), NOW(3)) AS lag_us "
+        f"FROM {CHANGES_TABLE} WHERE Change_ID > %s",
+        (last,),
+    )
+    r = cur.fetchone()
+    return r["backlog"], (r["lag_us"] or 0) / 1e6
+
+def prune(cur, last, keep):
+    """Delete applied changes older than `keep` seconds (other readers such as the app's record cache may still tail them)."""
+    cur.execute(
+        f"DELETE FROM {CHANGES_TABLE} WHERE Change_ID <= %s AND Changed_At < NOW(3) - INTERVAL %s SECOND LIMIT 10000",
+        (last, keep),
+    )
+    return cur.rowcount
+
+def run(a):
+    client = MongoClient(a.mongo_uri)
+    db = client[a.mongo_db]
+    col = db["patrons"]
+    state = db["replication_state"]
+    doc = state.find_one({"_id": STATE_ID})
+    if doc is None:
+        print("no checkpoint found, run 'setup' first")
+        sys.exit(1)
+    last = doc["change_id"]
+    codes = load_codes(db)
+    print(f"replicating {a.schema}.PATRONS -> {a.mongo_db}.patrons ({'compact' if codes else 'full'} layout) from change {last}")
+
+    conn = None
+    gaps = {}
+    applied = 0
+    window_start = time.time()
+    next_status = 0.0
+    while True:
+        try:
+            if conn is None:
+                conn = connect_mysql(a)
+                cur = conn.cursor(dictionary=True)
+
+            cur.execute(
+                f"SELECT Change_ID, Patron_ID FROM {CHANGES_TABLE} WHERE Change_ID > %s ORDER BY Change_ID LIMIT %s",
+                (last, a.batch),
+            )
+            rows = cur.fetchall()
+            ready = ready_changes(rows, last, gaps, a.gap_timeout)
+            if ready:
+                apply_changes(cur, col, db, codes, ready)
+                last = ready[-1]["Change_ID"]
+                # Checkpoint after the write: a crash in between re-applies the batch, which is idempotent
+                state.update_one(
+                    {"_id": STATE_ID},
+                    {"$set": {"change_id": last, "updated_at": datetime.now(timezone.utc)}, "$inc": {"applied": len(ready)}},
+                )
+                applied += len(ready)
+
+            if time.time() >= next_status:
+                backlog, lag = measure_lag(cur, last)
+                rate = applied / max(time.time() - window_start, 1e-9)
+                state.update_one(
+                    {"_id": STATE_ID},
+                    {"$set": {"backlog": backlog, "lag_s": round(lag, 3), "rate": round(rate, 1), "checked_at": datetime.now(timezone.utc)}},
+                )
+                pruned = prune(cur, last, a.keep) if a.keep >= 0 else 0
+                print(f"change {last} • backlog {backlog} • lag {lag:.1f}s • {rate:,.0f} changes/s • pruned {pruned}", flush=True)
+                applied, window_start = 0, time.time()
+                next_status = time.time() + a.status_interval
+
+            if len(ready) < a.batch:
+                time.sleep(a.poll)
+        except (mysql.connector.Error, PyMongoError) as e:
+            print(f"error: {e} (retrying from change {last})", flush=True)
+            try:
+                if conn is not None:
+                    conn.close()
+            except Exception:
+                pass
+            conn = None
+            time.sleep(5)
+
+parser = argparse.ArgumentParser(description="Replicate MySQL PATRONS changes into the MongoDB patrons collection")
+parser.add_argument("command", choices=["setup", "resync", "run", "status"],
+                    help="setup: create change log + triggers; resync: queue every patron; run: tail and apply; status: show checkpoint and lag")
+parser.add_argument("--host", default="localhost", help="MySQL host")
+parser.add_argument("--port", type=int, default=3306, help="MySQL port")
+parser.add_argument("--user", default="root", help="MySQL user")
+parser.add_argument("--password", "-p", help="MySQL password (omit to prompt)")
+parser.add_argument("--schema", default="sfpl", help="MySQL database with PATRONS")
+parser.add_argument("--mongo-uri", default="mongodb://localhost:27017/", help="MongoDB URI")
+parser.add_argument("--mongo-db", default="sfpl", help="MongoDB database with the patrons collection")
+parser.add_argument("--batch", type=int, default=1000, help="Changes read and applied per bulk_write")
+parser.add_argument("--poll", type=float, default=0.5, help="Seconds to wait when there is nothing to apply")
+parser.add_argument("--gap-timeout", type=float, default=10, help="Seconds to wait for a missing Change_ID to commit")
+parser.add_argument("--status-interval", type=float, default=5, help="Seconds between lag reports")
+parser.add_argument("--keep", type=int, default=3600, help="Seconds of applied changes to keep in the log (-1 keeps all)")
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    if not args.password:
+        args.password = getpass.getpass(f"Password for {args.user}@{args.host}: ")
+
+    if args.command == "run":
+        try:
+            run(args)
+        except KeyboardInterrupt:
+            print("stopped")
+        sys.exit(0)
+
+    connection = connect_mysql(args)
+    mongo = MongoClient(args.mongo_uri)[args.mongo_db]
+    try:
+        if args.command == "setup":
+            start = setup(connection, mongo)
+            print(f"change log {CHANGES_TABLE} and {len(TRIGGERS)} triggers ready (log at change {start})")
+        elif args.command == "resync":
+            print(f"queued {resync(connection)} patrons for replication")
+        else:
+            doc = mongo["replication_state"].find_one({"_id": STATE_ID})
+            if doc is None:
+                print("no checkpoint found, run 'setup' first")
+            else:
+                cur = connection.cursor(dictionary=True)
+                backlog, lag = measure_lag(cur, doc["change_id"])
+                cur.close()
+                print(f"checkpoint {doc['change_id']} • {doc.get('applied', 0)} applied • backlog {backlog} • lag {lag:.1f}s • last write {doc.get('updated_at')}")
+    finally:
+        connection.close()
@@ -0,0 +1,235 @@
+import os
+import re
+import sys
+import csv
+import json
+import time
+import getpass
+import argparse
+import statistics
+import subprocess
+
+CSV_FILE = "SFPL_DataSF_library-usage_Jan_2023.csv"
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "results", "benchmarks")
+
+try:
+    import resource  # not available on Windows
+except ImportError:
+    resource = None
+
+# Loading modes: name -> (backend, function building the command line)
+# Add newer loaders here so they are benchmarked the same way.
+LOADERS = {
+    "mysql": ("mysql", lambda a, csv_path: [
+        sys.executable, os.path.join(ROOT, "scripts", "load_table_to_mysql.py"),
+        "--file", csv_path, "--host", a.host, "--port", str(a.port),
+        "--user", a.user, "--password", a.password, "--schema", a.schema,
+    ]),
+    "mongodb": ("mongodb", lambda a, csv_path: [
+        sys.executable, os.path.join(ROOT, "mongo", "load_table_to_mongodb.py"),
+        "--file", csv_path, "--uri", a.mongo_uri, "--schema", a.schema,
+    ]),
+    "mysql-typed": ("mysql", lambda a, csv_path: [
+        sys.executable, os.path.join(ROOT, "scripts", "load_table_to_mysql.py"),
+        "--file", csv_path, "--host", a.host, "--port", str(a.port),
+        "--user", a.user, "--password", a.password, "--schema", a.schema,
+        "--schema-mode", "typed",
+    ]),
+    "mongodb-typed": ("mongodb", lambda a, csv_path: [
+        sys.executable, os.path.join(ROOT, "mongo", "load_table_to_mongodb.py"),
+        "--file", csv_path, "--uri", a.mongo_uri, "--schema", a.schema, "--schema-mode", "typed",
+    ]),
+    "mongodb-compact": ("mongodb", lambda a, csv_path: [
+        sys.executable, os.path.join(ROOT, "mongo", "load_table_to_mongodb.py"),
+        "--file", csv_path, "--uri", a.mongo_uri, "--schema", a.schema, "--layout", "compact",
+    ]),
+}
+
+def make_subset(src, rows, out_dir):
+    """
+    Copy the first `rows` data rows of the CSV, keeping the two header lines
+    the loaders skip. Returns (path, number of data rows written).
+    """
+    path = os.path.join(out_dir, f"bench_{rows}.csv")
+    written = 0
+    with open(src, newline="", encoding="utf-8") as fin, \
+         open(path, "w", newline="", encoding="utf-8") as fout:
+        reader = csv.reader(fin)
+        writer = csv.writer(fout)
+        for _ in range(2):
+            line = next(reader, None)
+            if line is not None:
+                writer.writerow(line)
+        for data in reader:
+            if written >= rows:
+                break
+            if not data or not any(cell.strip() for cell in data):
+                continue
+            writer.writerow(data)
+            written += 1
+    return path, written
+
+def reset_backend(backend, a):
+    """Drop the benchmark schema so every run starts from an empty database."""
+    if backend == "mysql":
+        import mysql.connector
+        conn = mysql.connector.connect(host=a.host, port=a.port, user=a.user, password=a.password)
+        cur = conn.cursor()
+        cur.execute(f"DROP DATABASE IF EXISTS `{a.schema}`")
+        cur.close()
+        conn.close()
+    else:
+        from pymongo import MongoClient
+        client = MongoClient(a.mongo_uri)
+        client.drop_database(a.schema)
+        client.close()
+
+def footprint(backend, a):
+    """On-disk size of data + indexes in bytes, as reported by the server."""
+    if backend == "mysql":
+        import mysql.connector
+        conn = mysql.connector.connect(host=a.host, port=a.port, user=a.user, password=a.password)
+        cur = conn.cursor()
+        cur.execute(f"ANALYZE TABLE `{a.schema}`.PATRONS")
+        cur.fetchall()
+        cur.execute(
+            "SELECT SUM(data_length), SUM(index_length) FROM information_schema.tables WHERE table_schema = %s",
+            (a.schema,)
+        )
+        data, index = cur.fetchone()
+        cur.close()
+        conn.close()
+        return int(data or 0), int(index or 0)
+    from pymongo import MongoClient
+    client = MongoClient(a.mongo_uri)
+    stats = client[a.schema].command("dbstats")
+    client.close()
+    return int(stats.get("storageSize", 0)), int(stats.get("indexSize", 0))
+
+def run_loader(cmd):
+    """
+    Run a loader and measure it from the outside.
+    Returns (wall seconds, cpu seconds, peak RSS in MB, stdout); CPU and RSS
+    are None where os.wait4 is not available.
+    """
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    out = proc.stdout.read()
+    proc.stdout.close()
+    cpu = rss = None
+    if hasattr(os, "wait4") and resource is not None:
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        cpu = usage.ru_utime + usage.ru_stime
+        # ru_maxrss is KB on Linux and bytes on macOS
+        rss = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    else:
+        proc.wait()
+    wall = time.perf_counter() - t0
+    if proc.returncode != 0 or "error" in out.lower():
+        raise RuntimeError(f"{os.path.basename(cmd[1])} failed:\n{out}")
+    return wall, cpu, rss, out
+
+def comparison_table(results):
+    """Markdown table with the median of the repeats per loader and size."""
+    groups = {}
+    for r in results:
+        groups.setdefault((r["rows"], r["loader"]), []).append(r)
+    lines = [
+        "| rows | loader | rows/sec | wall s | loader s | cpu s | peak RSS MB | data MB | index MB |",
+        "|---:|---|---:|---:|---:|---:|---:|---:|---:|",
+    ]
+
+    def med(runs, key):
+        values = [r[key] for r in runs if r[key] is not None]
+        return statistics.median(values) if values else None
+
+    def fmt(v, spec, scale=1):
+        return "-" if v is None else format(v / scale, spec)
+
+    for (rows, loader), runs in sorted(groups.items()):
+        lines.append(
+            f"| {rows} | {loader} | {fmt(med(runs, 'rows_per_sec'), ',.0f')} | {fmt(med(runs, 'wall_s'), '.2f')} | "
+            f"{fmt(med(runs, 'loader_s'), '.2f')} | {fmt(med(runs, 'cpu_s'), '.2f')} | {fmt(med(runs, 'peak_rss_mb'), '.0f')} | "
+            f"{fmt(med(runs, 'data_bytes'), '.1f', 1e6)} | {fmt(med(runs, 'index_bytes'), '.1f', 1e6)} |"
+        )
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the MySQL and MongoDB loaders at several dataset sizes")
+    parser.add_argument("--file", "-f", default=CSV_FILE, help="Source CSV (SFPL layout)")
+    parser.add_argument("--sizes", default="10000,100000,all", help="Comma separated row counts, 'all' for the whole file")
+    parser.add_argument("--loaders", default=",".join(LOADERS), help=f"Subset of: {', '.join(LOADERS)}")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per loader and size")
+    parser.add_argument("--host", default="localhost", help="MySQL host")
+    parser.add_argument("--port", type=int, default=3306, help="MySQL port")
+    parser.add_argument("--user", default="root", help="MySQL user")
+    parser.add_argument("--password", "-p", help="MySQL password (omit to prompt)")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017/", help="MongoDB URI")
+    parser.add_argument("--schema", default="sfpl_bench", help="Scratch database, dropped before every run")
+    parser.add_argument("--out", default=RESULTS_DIR, help="Directory for the JSON and Markdown results")
+    args = parser.parse_args()
+
+    loaders = [l.strip() for l in args.loaders.split(",") if l.strip()]
+    unknown = [l for l in loaders if l not in LOADERS]
+    if unknown:
+        parser.error(f"unknown loader(s): {', '.join(unknown)}")
+    if any(LOADERS[l][0] == "mysql" for l in loaders) and not args.password:
+        args.password = getpass.getpass(f"Password for {args.user}@{args.host}: ")
+
+    os.makedirs(args.out, exist_ok=True)
+    work_dir = os.path.join(args.out, "tmp")
+    os.makedirs(work_dir, exist_ok=True)
+
+    results = []
+    for size in [s.strip() for s in args.sizes.split(",") if s.strip()]:
+        limit = sys.maxsize if size == "all" else int(size)
+        csv_path, rows = make_subset(args.file, limit, work_dir)
+        for name in loaders:
+            backend, build = LOADERS[name]
+            for run in range(1, args.repeat + 1):
+                reset_backend(backend, args)
+                print(f"{name}: {rows} rows, run {run}/{args.repeat}...", flush=True)
+                wall, cpu, rss, out = run_loader(build(args, csv_path))
+                m = re.search(r"in ([\d.]+) seconds", out)
+                data_bytes, index_bytes = footprint(backend, args)
+                result = {
+                    "loader": name,
+                    "backend": backend,
+                    "rows": rows,
+                    "run": run,
+                    "wall_s": round(wall, 3),
+                    "loader_s": float(m.group(1)) if m else None,
+                    "rows_per_sec": round(rows / wall, 1) if wall else None,
+                    "cpu_s": round(cpu, 3) if cpu is not None else None,
+                    "peak_rss_mb": round(rss, 1) if rss is not None else None,
+                    "data_bytes": data_bytes,
+                    "index_bytes": index_bytes,
+                }
+                results.append(result)
+                print(f"  {result['rows_per_sec']:,.0f} rows/sec, {wall:.2f}s wall", flush=True)
+        os.remove(csv_path)
+
+    for name in loaders:
+        reset_backend(LOADERS[name][0], args)
+
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    meta = {
+        "started": stamp,
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "source": os.path.basename(args.file),
+    }
+    json_path = os.path.join(args.out, f"loaders-{stamp}.json")
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=2)
+
+    table = comparison_table(results)
+    md_path = os.path.join(args.out, f"loaders-{stamp}.md")
+    with open(md_path, "w", encoding="utf-8") as f:
+        f.write(f"# Loader benchmark {stamp}\n\n{table}\n")
+
+    print()
+    print(table)
+    print(f"\nResults written to {json_path} and {md_path}")
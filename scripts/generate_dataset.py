@@ -0,0 +1,220 @@
+import os
+import csv
+import json
+import time
+import argparse
+from collections import Counter
+from multiprocessing import Pool
+
+import numpy as np
+
+CSV_FILE = "SFPL_DataSF_library-usage_Jan_2023.csv"
+PROFILE_FILE = "sfpl_profile.json"
+
+COLUMNS = [
+    'Patron_Type_Code',             # 0
+    'Patron_Type_Definition',       # 1
+    'Total_Checkouts',              # 2
+    'Total_Renewals',               # 3
+    'Age_Range',                    # 4
+    'Home_Library_Code',            # 5
+    'Home_Library_Definition',      # 6
+    'Circulation_Active_Month',     # 7
+    'Circulation_Active_Year',      # 8
+    'Notification_Preference_Code', # 9
+    'Notice_Preference_Definition', # 10
+    'Provided_Email_Address',       # 11
+    'Within_San_Francisco_County',  # 12
+    'Year_Patron_Registered'        # 13
+]
+
+# Columns sampled together so combinations that never occur in the real
+# data (a code with the wrong definition, registered after last activity)
+# are not generated. Checkouts and renewals are handled separately.
+GROUPS = {
+    "patron": [0, 1, 4],
+    "library": [5, 6],
+    "notice": [9, 10],
+    "activity": [7, 8, 13],
+    "flags": [11, 12],
+}
+QUANTILES = 1001
+RENEWAL_BUCKETS = 10
+
+def fit_profile(path):
+    """
+    Read the real CSV and return the distributions the generator samples from:
+    joint frequencies per column group, checkout quantiles, and renewal
+    quantiles for each checkout decile.
+    """
+    counts = {name: Counter() for name in GROUPS}
+    checkouts, renewals = [], []
+
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        preamble = next(reader, None)
+        header = next(reader, None)
+
+        for data in reader:
+            if not data or not any(cell.strip() for cell in data):
+                continue
+
+            def g(i):
+                return data[i].strip() if i < len(data) and data[i] is not None else ""
+
+            for name, cols in GROUPS.items():
+                counts[name][tuple(g(i) for i in cols)] += 1
+            try:
+                c = int(g(2)) if g(2) else 0
+            except ValueError:
+                c = 0
+            try:
+                r = int(g(3)) if g(3) else 0
+            except ValueError:
+                r = 0
+            checkouts.append(c)
+            renewals.append(r)
+
+    checkouts = np.array(checkouts)
+    renewals = np.array(renewals)
+    qs = np.linspace(0, 1, QUANTILES)
+
+    # Renewals depend strongly on checkouts, so keep one renewal
+    # distribution per checkout decile (by rank, ties broken by order).
+    ranks = np.argsort(np.argsort(checkouts, kind="stable"), kind="stable")
+    bucket = ranks * RENEWAL_BUCKETS // max(len(checkouts), 1)
+    renewal_q = []
+    for b in range(RENEWAL_BUCKETS):
+        values = renewals[bucket == b]
+        renewal_q.append(np.quantile(values, qs).tolist() if len(values) else [0.0] * QUANTILES)
+
+    return {
+        "source": os.path.basename(path),
+        "rows": int(len(checkouts)),
+        "preamble": preamble or [],
+        "header": header or COLUMNS,
+        "groups": {
+            name: [[list(key), n] for key, n in c.most_common()]
+            for name, c in counts.items()
+        },
+        "checkouts_q": np.quantile(checkouts, qs).tolist() if len(checkouts) else [0.0] * QUANTILES,
+        "renewals_q": renewal_q,
+    }
+
+def csv_field(value):
+    """Quote a value the way csv.writer would (only when needed)."""
+    if any(ch in value for ch in ',"\r\n'):
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+def compile_profile(profile):
+    """Per group: cumulative probabilities and one CSV-ready string array per column."""
+    groups = {}
+    for name, entries in profile["groups"].items():
+        weights = np.array([n for _, n in entries], dtype=np.float64)
+        cdf = np.cumsum(weights / weights.sum())
+        cdf[-1] = 1.0
+        columns = [
+            np.array([csv_field(key[j]) for key, _ in entries], dtype=object)
+            for j in range(len(GROUPS[name]))
+        ]
+        groups[name] = (cdf, columns)
+    return {
+        "groups": groups,
+        "checkouts_q": np.array(profile["checkouts_q"]),
+        "renewals_q": np.array(profile["renewals_q"]),
+    }
+
+def generate_chunk(compiled, seed, chunk, rows):
+    """
+    CSV text for `rows` rows. Each chunk has its own generator seeded from
+    (seed, chunk), so output is identical for any worker count.
+    """
+    rng = np.random.default_rng([seed, chunk])
+    cols = [None] * len(COLUMNS)
+
+    for name, (cdf, columns) in compiled["groups"].items():
+        idx = np.searchsorted(cdf, rng.random(rows), side="right")
+        np.minimum(idx, len(cdf) - 1, out=idx)
+        for j, col in enumerate(GROUPS[name]):
+            cols[col] = columns[j][idx]
+
+    # Inverse-CDF sampling from the fitted quantiles keeps the zero mass and the long tail
+    grid = np.linspace(0, 1, QUANTILES)
+    u = rng.random(rows)
+    checkouts = np.rint(np.interp(u, grid, compiled["checkouts_q"])).astype(np.int64)
+    renewals = np.empty(rows, dtype=np.int64)
+    bucket = np.minimum((u * RENEWAL_BUCKETS).astype(np.int64), RENEWAL_BUCKETS - 1)
+    v = rng.random(rows)
+    for b in range(RENEWAL_BUCKETS):
+        mask = bucket == b
+        renewals[mask] = np.rint(np.interp(v[mask], grid, compiled["renewals_q"][b]))
+    cols[2] = checkouts.astype(str).tolist()
+    cols[3] = renewals.astype(str).tolist()
+
+    cols = [c if isinstance(c, list) else c.tolist() for c in cols]
+    return "\r\n".join(map(",".join, zip(*cols))) + "\r\n"
+
+_compiled = None
+
+def _init_worker(profile):
+    global _compiled
+    _compiled = compile_profile(profile)
+
+def _work(task):
+    seed, chunk, rows = task
+    return generate_chunk(_compiled, seed, chunk, rows)
+
+parser = argparse.ArgumentParser(description="Generate synthetic SFPL library-usage CSVs")
+sub = parser.add_subparsers(dest="command", required=True)
+
+p_fit = sub.add_parser("fit", help="Fit column distributions from the real CSV")
+p_fit.add_argument("--file", "-f", default=CSV_FILE, help="Real SFPL CSV")
+p_fit.add_argument("--out", "-o", default=PROFILE_FILE, help="Profile JSON to write")
+
+p_gen = sub.add_parser("generate", help="Write a synthetic CSV from a fitted profile")
+p_gen.add_argument("--profile", default=PROFILE_FILE, help="Profile JSON from 'fit'")
+p_gen.add_argument("--file", "-f", help="Fit from this CSV instead of reading --profile")
+p_gen.add_argument("--rows", "-n", type=int, default=1_000_000, help="Number of data rows")
+p_gen.add_argument("--seed", type=int, default=2023, help="Random seed (same seed, same file)")
+p_gen.add_argument("--chunk", type=int, default=1_000_000, help="Rows generated per task")
+p_gen.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+p_gen.add_argument("--out", "-o", default="synthetic.csv", help="CSV to write")
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    start_time = time.time()
+
+    if args.command == "fit":
+        profile = fit_profile(args.file)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(profile, f, indent=1)
+        print(f"Fitted {profile['rows']} rows from {args.file} into {args.out} in {time.time() - start_time:.3f} seconds")
+    else:
+        if args.file:
+            profile = fit_profile(args.file)
+        else:
+            with open(args.profile, encoding="utf-8") as f:
+                profile = json.load(f)
+
+        tasks = []
+        for chunk, first in enumerate(range(0, args.rows, args.chunk)):
+            tasks.append((args.seed, chunk, min(args.chunk, args.rows - first)))
+
+        with open(args.out, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            # Same two header lines as the real file; the loaders skip both
+            writer.writerow(profile["preamble"])
+            writer.writerow(profile["header"])
+            f.flush()
+            if args.workers > 1 and len(tasks) > 1:
+                with Pool(args.workers, initializer=_init_worker, initargs=(profile,)) as pool:
+                    for text in pool.imap(_work, tasks):
+                        f.write(text)
+            else:
+                _init_worker(profile)
+                for task in tasks:
+                    f.write(_work(task))
+
+        dt = time.time() - start_time
+        print(f"Wrote {args.rows} rows to {args.out} in {dt:.3f} seconds ({args.rows / dt:,.0f} rows/sec)")
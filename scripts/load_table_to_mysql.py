@@ -7,6 +7,16 @@ import getpass
 
 CSV_FILE = "SFPL_DataSF_library-usage_Jan_2023.csv"
 
+# Source of truth for the typed encoding (years as numbers, months as
+# YYYYMM); copied in mongo/load_table_to_mongodb.py and, accepting more
+# input forms, in app/shared.py for both apps
+MONTHS = ["january", "february", "march", "april", "may", "june", "july",
+          "august", "september", "october", "november", "december"]
+
+# Typed schema: PATRONS is RANGE-partitioned by Circulation_Active_Year, one
+# partition per year from PARTITION_FROM (NULL = never active goes to p_none)
+PARTITION_FROM = 2003
+
 def parse_bool(value): 
     if value is None:
         return None
@@ -18,6 +28,48 @@ def parse_bool(value):
     else:
         return None
 
+def parse_year(value):
+    """'2016' -> 2016; 'None', '' or anything else -> None."""
+    v = (value or "").strip()
+    return int(v) if v.isdigit() and 1800 <= int(v) <= 2200 else None
+
+def parse_year_month(month, year):
+    """Month name/abbreviation/number and a year -> YYYYMM integer (or None)."""
+    m = (month or "").strip().lower()
+    if m.isdigit() and 1 <= int(m) <= 12:
+        n = int(m)
+    else:
+        n = next((i + 1 for i, name in enumerate(MONTHS) if len(m) >= 3 and name.startswith(m)), None)
+    if n is None or year is None:
+        return None
+    return year * 100 + n
+
+def partitions_ddl():
+    parts = ["PARTITION p_none VALUES LESS THAN (0)",
+             f"PARTITION p_before_{PARTITION_FROM} VALUES LESS THAN ({PARTITION_FROM})"]
+    for y in range(PARTITION_FROM, time.localtime().tm_year + 1):
+        parts.append(f"PARTITION p{y} VALUES LESS THAN ({y + 1})")
+    parts.append("PARTITION p_future VALUES LESS THAN MAXVALUE")
+    return "PARTITION BY RANGE (Circulation_Active_Year) (\n        " + ",\n        ".join(parts) + "\n    )"
+
+def existing_patrons_mode(cursor, schema):
+    """'text' or 'typed' for an existing PATRONS table, None if there is none."""
+    cursor.execute(
+        "SELECT DATA_TYPE FROM information_schema.COLUMNS "
+        "WHERE TABLE_SCHEMA = %s AND TABLE_NAME = 'PATRONS' AND COLUMN_NAME = 'Circulation_Active_Year'",
+        (schema,),
+    )
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = %s AND TABLE_NAME = 'PATRONS' AND PARTITION_NAME IS NOT NULL",
+        (schema,),
+    )
+    partitioned = cursor.fetchone()[0] > 0
+    return "typed" if row[0] == "smallint" and partitioned else "text"
+
 parser = argparse.ArgumentParser(description="Load a CSV into MySQL (small helper)")
 parser.add_argument("--file", "-f", default=CSV_FILE, help="Path to CSV file")
 parser.add_argument("--host", default="localhost", help="MySQL host")
@@ -25,6 +77,10 @@ parser.add_argument("--port", type=int, default=3306, help="MySQL port")
 parser.add_argument("--user", default="root", help="MySQL user")
 parser.add_argument("--password", "-p", help="MySQL password (omit to prompt)")
 parser.add_argument("--schema", default="sfpl", help="Database/schema name to use/create")
+parser.add_argument("--schema-mode", choices=["text", "typed"], default="text",
+                    help="typed: SMALLINT years, YYYYMM month, PATRONS partitioned by activity year")
+parser.add_argument("--replace", action="store_true",
+                    help="Drop an existing PATRONS table created with the other --schema-mode")
 args = parser.parse_args()
 
 if not args.password:
@@ -36,6 +92,7 @@ DB_PORT = args.port
 DB_USER = args.user
 DB_PASSWORD = args.password
 DB_SCHEMA = args.schema
+TYPED = args.schema_mode == "typed"
 
 try:
     connection = mysql.connector.connect(
@@ -84,41 +141,89 @@ try:
     );
     ''')
 
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS PATRONS (
-        Patron_ID INT AUTO_INCREMENT PRIMARY KEY,
+    # CREATE TABLE IF NOT EXISTS would quietly keep a PATRONS of the other mode
+    existing = existing_patrons_mode(cursor, DB_SCHEMA)
+    if existing is not None and existing != args.schema_mode:
+        if not args.replace:
+            print(f"PATRONS in `{DB_SCHEMA}` was created with --schema-mode {existing}, not {args.schema_mode}. "
+                  f"Use --replace to drop it and load it again, or pick another --schema.")
+            sys.exit(1)
+        print(f"dropping the existing {existing} PATRONS table (--replace)")
+        cursor.execute("DROP TABLE PATRONS")
+
+    if TYPED:
+        # Partitioned InnoDB tables can't have foreign keys, and every unique
+        # key must contain the partition column, so Patron_ID gets a plain
+        # index and the lookup tables are enforced by the app instead.
+        # AUTO_INCREMENT only keeps new IDs unique, so the app doesn't let
+        # Patron_ID be edited in this mode.
+        cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS PATRONS (
+            Patron_ID INT AUTO_INCREMENT,
+
+            Patron_Type_Code VARCHAR(20),
+            Patron_Type_Definition VARCHAR(50) NOT NULL,
+
+            Total_Checkouts INT,
+            Total_Renewals INT,
+
+            Age_Range VARCHAR(50),
+
+            Home_Library_Code VARCHAR(20),
+            Home_Library_Definition VARCHAR(100) NOT NULL,
+
+            Circulation_Active_Month MEDIUMINT UNSIGNED, -- YYYYMM, e.g. 202211
+            Circulation_Active_Year SMALLINT,
+
+            Notification_Preference_Code VARCHAR(20),
+            Notice_Preference_Definition VARCHAR(50),
+
+            Provided_Email_Address BOOLEAN,
+            Within_San_Francisco_County BOOLEAN,
+            Year_Patron_Registered SMALLINT,
+
+            KEY idx_patron_id (Patron_ID),
+            KEY idx_active_month (Circulation_Active_Month),
+            KEY idx_year_registered (Year_Patron_Registered)
+        )
+        {partitions_ddl()};
+        ''')
+    else:
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS PATRONS (
+            Patron_ID INT AUTO_INCREMENT PRIMARY KEY,
 
-        Patron_Type_Code VARCHAR(20),                -- CSV col 0
-        Patron_Type_Definition VARCHAR(50) NOT NULL, -- CSV col 1
+            Patron_Type_Code VARCHAR(20),                -- CSV col 0
+            Patron_Type_Definition VARCHAR(50) NOT NULL, -- CSV col 1
 
-        Total_Checkouts INT,                         -- CSV col 2
-        Total_Renewals INT,                          -- CSV col 3
+            Total_Checkouts INT,                         -- CSV col 2
+            Total_Renewals INT,                          -- CSV col 3
 
-        Age_Range VARCHAR(50),                       -- CSV col 4
+            Age_Range VARCHAR(50),                       -- CSV col 4
 
-        Home_Library_Code VARCHAR(20),               -- CSV col 5
-        Home_Library_Definition VARCHAR(100) NOT NULL, -- CSV col 6
+            Home_Library_Code VARCHAR(20),               -- CSV col 5
+            Home_Library_Definition VARCHAR(100) NOT NULL, -- CSV col 6
 
-        Circulation_Active_Month VARCHAR(20),        -- CSV col 7
-        Circulation_Active_Year VARCHAR(10),         -- CSV col 8
+            Circulation_Active_Month VARCHAR(20),        -- CSV col 7
+            Circulation_Active_Year VARCHAR(10),         -- CSV col 8
 
-        Notification_Preference_Code VARCHAR(20),    -- CSV col 9
-        Notice_Preference_Definition VARCHAR(50),    -- CSV col 10
+            Notification_Preference_Code VARCHAR(20),    -- CSV col 9
+            Notice_Preference_Definition VARCHAR(50),    -- CSV col 10
 
-        Provided_Email_Address BOOLEAN,              -- CSV col 11
-        Within_San_Francisco_County BOOLEAN,         -- CSV col 12
-        Year_Patron_Registered VARCHAR(10),          -- CSV col 13
+            Provided_Email_Address BOOLEAN,              -- CSV col 11
+            Within_San_Francisco_County BOOLEAN,         -- CSV col 12
+            Year_Patron_Registered VARCHAR(10),          -- CSV col 13
 
-        FOREIGN KEY (Patron_Type_Definition)
-            REFERENCES PATRONTYPES(Patron_Type_Definition),
-        FOREIGN KEY (Age_Range)
-            REFERENCES AGERANGES(Age_Range),
-        FOREIGN KEY (Home_Library_Definition)
-            REFERENCES LIBRARIES(Home_Library_Definition),
-        FOREIGN KEY (Notice_Preference_Definition)
-            REFERENCES NOTICES(Notice_Preference_Definition)
-    );
-    ''')
+            FOREIGN KEY (Patron_Type_Definition)
+                REFERENCES PATRONTYPES(Patron_Type_Definition),
+            FOREIGN KEY (Age_Range)
+                REFERENCES AGERANGES(Age_Range),
+            FOREIGN KEY (Home_Library_Definition)
+                REFERENCES LIBRARIES(Home_Library_Definition),
+            FOREIGN KEY (Notice_Preference_Definition)
+                REFERENCES NOTICES(Notice_Preference_Definition)
+        );
+        ''')
 
     patron_types = set()
     age_ranges = set()
@@ -188,13 +293,16 @@ try:
 
             circ_month = g(7)
             circ_year  = g(8)
+            if TYPED:
+                circ_year = parse_year(circ_year)
+                circ_month = parse_year_month(circ_month, circ_year)
 
             notif_pref_code = g(9)
             notice_pref_def = g(10)
 
             provided_email = parse_bool(g(11))
             within_sf      = parse_bool(g(12))
-            year_reg       = g(13)
+            year_reg       = parse_year(g(13)) if TYPED else g(13)
 
             if patron_type_def:
                 patron_types.add(patron_type_def)
@@ -0,0 +1,414 @@
+import os
+import sys
+import json
+import time
+import random
+import getpass
+import argparse
+import threading
+
+# app/db_pool.py: the MySQL app's connection pool and prepared statements;
+# mongo/compact_layout.py: the keys of the compact document layout
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "app"))
+sys.path.insert(0, os.path.join(ROOT, "mongo"))
+
+OPERATIONS = ("view", "lookup", "search_exact", "search_like", "insert", "update", "delete")
+DEFAULT_MIX = "view=1,lookup=40,search_exact=20,search_like=10,insert=12,update=12,delete=5"
+
+# The app's pool settings (DB_POOL_* in app/app.py); MongoDB uses pymongo's
+# defaults like mongo/app.py (100 connections, no wait limit)
+MYSQL_POOL_MIN, MYSQL_POOL_MAX, MYSQL_POOL_WAIT = 2, 10, 5.0
+MYSQL_POOL_PING, MYSQL_POOL_IDLE = 30.0, 300.0
+
+class MySQLWorkload:
+    """
+    The queries app/app.py runs for each tab, through the app's own
+    ConnectionPool: searches and view all as plain queries with the
+    MAX_EXECUTION_TIME deadline, lookup/insert/update/delete as its prepared statements.
+    """
+
+    backend = "mysql"
+
+    def __init__(self, a):
+        import mysql.connector
+        from db_pool import ConnectionPool, prepared_queries
+        self.errors = mysql.connector.errors
+        self.timeout_ms = a.timeout_ms
+        self.pool = ConnectionPool(
+            a.pool_min,
+            a.pool_max or MYSQL_POOL_MAX,
+            MYSQL_POOL_WAIT if a.pool_wait is None else a.pool_wait,
+            MYSQL_POOL_PING,
+            MYSQL_POOL_IDLE,
+            host=a.host,
+            port=a.port,
+            user=a.user,
+            password=a.password,
+            database=a.schema
+        )
+        self.statements = prepared_queries(["Total_Checkouts"])
+        self.lookups = {
+            "Patron_Type_Definition": [r[0] for r in self.query("SELECT Patron_Type_Definition FROM PATRONTYPES")],
+            "Age_Range": [r[0] for r in self.query("SELECT Age_Range FROM AGERANGES")],
+            "Home_Library_Definition": [r[0] for r in self.query("SELECT Home_Library_Definition FROM LIBRARIES")],
+            "Notice_Preference_Definition": [r[0] for r in self.query("SELECT Notice_Preference_Definition FROM NOTICES")],
+        }
+        self.min_id, self.max_id = self.query("SELECT MIN(Patron_ID), MAX(Patron_ID) FROM PATRONS")[0]
+        # --schema-mode typed stores years as SMALLINT and the month as YYYYMM
+        typed = self.query(
+            "SELECT DATA_TYPE FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() "
+            "AND TABLE_NAME = 'PATRONS' AND COLUMN_NAME = 'Circulation_Active_Year'"
+        )
+        self.typed = bool(typed) and typed[0][0] == "smallint"
+
+    def checkout(self, run):
+        """Run `run(conn)` on a pooled connection; connection errors drop it from the pool like the app does."""
+        conn = self.pool.acquire()
+        broken = False
+        try:
+            return run(conn)
+        except (self.errors.InterfaceError, self.errors.OperationalError):
+            broken = True
+            raise
+        finally:
+            self.pool.release(conn, broken)
+
+    def query(self, sql, params=()):
+        """SELECT like the app's run_query, with the server-side deadline hint."""
+        def run(conn):
+            cur = conn.cursor()
+            cur.execute(f"SELECT /*+ MAX_EXECUTION_TIME({int(self.timeout_ms)}) */{sql.lstrip()[6:]}", params)
+            rows = cur.fetchall()
+            cur.close()
+            return rows
+        return self.checkout(run)
+
+    def prepared(self, name, params):
+        """One of the app's prepared statements; returns the rows, or the last insert id."""
+        sql = self.statements[name]
+
+        def run(conn):
+            cur = self.pool.prepared(conn, sql)
+            cur.execute(sql, params)
+            return cur.fetchall() if cur.description else cur.lastrowid
+        return self.checkout(run)
+
+    def view(self, rnd):
+        return len(self.query("SELECT * FROM PATRONS ORDER BY Patron_ID DESC"))
+
+    def lookup(self, rnd, patron_id):
+        return len(self.prepared("get_by_id", (patron_id,)))
+
+    def search_exact(self, rnd, field, value):
+        return len(self.query(f"SELECT * FROM PATRONS WHERE {field} = %s", (value,)))
+
+    def search_like(self, rnd, field, value):
+        return len(self.query(f"SELECT * FROM PATRONS WHERE {field} LIKE %s", (f"%{value}%",)))
+
+    def insert(self, rnd, values):
+        month, year = (202301, 2023) if self.typed else ("January", "2023")
+        data = (
+            values["Patron_Type_Definition"], rnd.randint(0, 50), rnd.randint(0, 10),
+            values["Age_Range"], values["Home_Library_Definition"], month, year,
+            values["Notice_Preference_Definition"], rnd.randint(0, 1), year, rnd.randint(0, 1),
+        )
+        return self.prepared("insert", data)
+
+    def update(self, rnd, patron_id):
+        self.prepared("update_Total_Checkouts", (rnd.randint(0, 500), patron_id))
+
+    def delete(self, rnd, patron_id):
+        self.prepared("delete", (patron_id,))
+
+    def classify(self, e):
+        errno = getattr(e, "errno", None)
+        if isinstance(e, self.errors.PoolError):
+            return "pool_exhausted"
+        if errno in (1205, 1213):
+            return "lock_wait"
+        if errno == 1062:
+            return "duplicate_id"
+        if errno == 3024:
+            return "timeout"
+        return "other"
+
+class MongoWorkload:
+    """
+    The operations mongo/app.py runs for each tab, including its max+1 id
+    assignment and, for the compact layout, its key and code translation.
+    """
+
+    backend = "mongodb"
+
+    def __init__(self, a):
+        from pymongo import MongoClient, errors
+        from compact_layout import SHORT_KEYS
+        self.short_keys = SHORT_KEYS
+        self.errors = errors
+        pool = {}
+        if a.pool_max:
+            pool["maxPoolSize"] = a.pool_max
+        if a.pool_wait is not None:
+            pool["waitQueueTimeoutMS"] = int(a.pool_wait * 1000)
+        self.client = MongoClient(a.mongo_uri, **pool)
+        self.timeout_ms = a.timeout_ms
+        self.col = self.client[a.schema]["patrons"]
+        self.codes = {d["_id"]: d["values"] for d in self.client[a.schema]["patron_codes"].find()}
+        self.compact = bool(self.codes)
+        if self.compact:
+            self.lookups = {f: [v for v in values if v] for f, values in self.codes.items()}
+        else:
+            self.lookups = {
+                f: [v for v in self.col.distinct(f) if v]
+                for f in ("Patron_Type_Definition", "Age_Range", "Home_Library_Definition", "Notice_Preference_Definition")
+            }
+        first = self.col.find_one(sort=[("_id", 1)])
+        last = self.col.find_one(sort=[("_id", -1)])
+        self.min_id = first["_id"] if first else 1
+        self.max_id = last["_id"] if last else 1
+        self.typed = isinstance((first or {}).get(self.key("Year_Patron_Registered")), int)
+
+    def key(self, field):
+        return self.short_keys[field] if self.compact else field
+
+    def code(self, field, value):
+        return self.codes[field].index(value) if self.compact and value is not None else value
+
+    def find(self, query, sort=None):
+        """find() with the app's max_time_ms deadline."""
+        cursor = self.col.find(query).max_time_ms(self.timeout_ms)
+        if sort:
+            cursor = cursor.sort(*sort)
+        return list(cursor)
+
+    def view(self, rnd):
+        return len(self.find({}, ("_id", 1)))
+
+    def lookup(self, rnd, patron_id):
+        return 1 if self.col.find_one({"_id": patron_id}, max_time_ms=self.timeout_ms) else 0
+
+    def search_exact(self, rnd, field, value):
+        return len(self.find({self.key(field): self.code(field, value)}))
+
+    def search_like(self, rnd, field, value):
+        if self.compact:
+            codes = [i for i, v in enumerate(self.codes[field]) if value.lower() in v.lower()]
+            return len(self.find({self.key(field): {"$in": codes}}))
+        return len(self.find({field: {"$regex": value, "$options": "i"}}))
+
+    def insert(self, rnd, values):
+        last = self.col.find_one(sort=[("_id", -1)])
+        next_id = (last["_id"] + 1) if last else 1
+        month, year = (202301, 2023) if self.typed else ("January", "2023")
+        doc = {
+            "Patron_ID": next_id,
+            "Patron_Type_Definition": values["Patron_Type_Definition"],
+            "Total_Checkouts": rnd.randint(0, 50),
+            "Total_Renewals": rnd.randint(0, 10),
+            "Age_Range": values["Age_Range"],
+            "Home_Library_Definition": values["Home_Library_Definition"],
+            "Circulation_Active_Month": month,
+            "Circulation_Active_Year": year,
+            "Notice_Preference_Definition": values["Notice_Preference_Definition"],
+            "Provided_Email_Address": rnd.random() < 0.5,
+            "Year_Patron_Registered": year,
+            "Within_San_Francisco_County": rnd.random() < 0.5,
+        }
+        if self.compact:
+            doc = {self.key(f): self.code(f, v) for f, v in doc.items() if v is not None}
+        else:
+            doc = {"_id": next_id, **doc}
+        self.col.insert_one(doc)
+        return next_id
+
+    def update(self, rnd, patron_id):
+        self.col.update_one({"_id": patron_id}, {"$set": {self.key("Total_Checkouts"): rnd.randint(0, 500)}})
+
+    def delete(self, rnd, patron_id):
+        self.col.delete_one({"_id": patron_id})
+
+    def classify(self, e):
+        if isinstance(e, self.errors.DuplicateKeyError):
+            return "duplicate_id"
+        if isinstance(e, self.errors.WaitQueueTimeoutError):
+            return "pool_exhausted"
+        if isinstance(e, self.errors.ExecutionTimeout):
+            return "timeout"
+        if getattr(e, "code", None) == 112:  # WriteConflict
+            return "lock_wait"
+        return "other"
+
+class Stats:
+    """Latency samples and error counts per operation, shared by all users."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+
+    def ok(self, op, seconds):
+        with self.lock:
+            self.samples.setdefault(op, []).append(seconds)
+
+    def fail(self, op, kind):
+        with self.lock:
+            errs = self.errors.setdefault(op, {})
+            errs[kind] = errs.get(kind, 0) + 1
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    i = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[i]
+
+def user_loop(wl, stats, mix, deadline, seed, inserted, inserted_lock):
+    """One simulated librarian: pick an operation from the mix, run it, repeat until the deadline."""
+    rnd = random.Random(seed)
+    ops, weights = zip(*mix.items())
+    text_fields = [f for f, v in wl.lookups.items() if v]
+    while time.time() < deadline:
+        op = rnd.choices(ops, weights)[0]
+        target = None
+        if op in ("update", "delete"):
+            # Only touch rows created by this run so existing data survives
+            with inserted_lock:
+                if inserted:
+                    target = inserted.pop(rnd.randrange(len(inserted))) if op == "delete" else rnd.choice(inserted)
+            if target is None:
+                op = "insert"
+        t0 = time.perf_counter()
+        try:
+            if op == "view":
+                wl.view(rnd)
+            elif op == "lookup":
+                wl.lookup(rnd, rnd.randint(wl.min_id, wl.max_id))
+            elif op == "search_exact":
+                field = rnd.choice(text_fields)
+                wl.search_exact(rnd, field, rnd.choice(wl.lookups[field]))
+            elif op == "search_like":
+                field = rnd.choice(text_fields)
+                value = rnd.choice(wl.lookups[field])
+                start = rnd.randrange(max(len(value) - 3, 1))
+                wl.search_like(rnd, field, value[start:start + 3])
+            elif op == "insert":
+                values = {f: rnd.choice(v) if v else None for f, v in wl.lookups.items()}
+                new_id = wl.insert(rnd, values)
+                with inserted_lock:
+                    inserted.append(new_id)
+            elif op == "update":
+                wl.update(rnd, target)
+            elif op == "delete":
+                wl.delete(rnd, target)
+            stats.ok(op, time.perf_counter() - t0)
+        except Exception as e:
+            stats.fail(op, wl.classify(e))
+
+def report(stats, elapsed, backend, users):
+    rows = []
+    for op in sorted(set(stats.samples) | set(stats.errors)):
+        lat = sorted(stats.samples.get(op, []))
+        errs = stats.errors.get(op, {})
+        total = len(lat) + sum(errs.values())
+
+        def ms(q):
+            v = percentile(lat, q)
+            return round(v * 1000, 2) if v is not None else None
+
+        rows.append({
+            "op": op,
+            "ops": total,
+            "ok": len(lat),
+            "ops_per_sec": round(total / elapsed, 2),
+            "error_rate": round(sum(errs.values()) / total, 4) if total else 0.0,
+            "p50_ms": ms(0.50),
+            "p95_ms": ms(0.95),
+            "p99_ms": ms(0.99),
+            "max_ms": round(lat[-1] * 1000, 2) if lat else None,
+            "errors": errs,
+        })
+    total_ops = sum(r["ops"] for r in rows)
+    summary = {
+        "backend": backend,
+        "users": users,
+        "seconds": round(elapsed, 2),
+        "ops": total_ops,
+        "ops_per_sec": round(total_ops / elapsed, 2) if elapsed else None,
+        "operations": rows,
+    }
+
+    def fmt(v):
+        return "-" if v is None else f"{v}"
+
+    print(f"\n{backend}: {users} users, {elapsed:.1f}s, {total_ops} ops, {summary['ops_per_sec']} ops/sec\n")
+    print(f"{'op':<14}{'ops':>8}{'ops/s':>9}{'err%':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}  errors")
+    for r in rows:
+        errs = ", ".join(f"{k}={v}" for k, v in sorted(r["errors"].items())) or "-"
+        print(f"{r['op']:<14}{r['ops']:>8}{r['ops_per_sec']:>9}{r['error_rate'] * 100:>6.1f}%"
+              f"{fmt(r['p50_ms']):>9}{fmt(r['p95_ms']):>9}{fmt(r['p99_ms']):>9}{fmt(r['max_ms']):>9}  {errs}")
+    return summary
+
+parser = argparse.ArgumentParser(description="Simulate concurrent librarians against the MySQL or MongoDB patrons data")
+parser.add_argument("backend", choices=["mysql", "mongodb"])
+parser.add_argument("--users", "-u", type=int, default=20, help="Concurrent simulated users")
+parser.add_argument("--duration", "-d", type=float, default=60, help="Seconds to run")
+parser.add_argument("--mix", default=DEFAULT_MIX, help="Operation weights, e.g. lookup=40,insert=10")
+parser.add_argument("--seed", type=int, default=1, help="Random seed")
+parser.add_argument("--pool-min", type=int, default=MYSQL_POOL_MIN, help="MySQL: connections opened at start (the app's DB_POOL_MIN)")
+parser.add_argument("--pool-max", type=int, help="Max connections (default as in the apps: MySQL DB_POOL_MAX 10, MongoDB pymongo's 100)")
+parser.add_argument("--pool-wait", type=float, help="Seconds to wait for a free connection (default as in the apps: MySQL DB_POOL_WAIT 5, MongoDB no limit)")
+parser.add_argument("--timeout-ms", type=int, default=30000, help="Per-query deadline for reads (the apps' QUERY_TIMEOUT_MS)")
+parser.add_argument("--host", default="localhost", help="MySQL host")
+parser.add_argument("--port", type=int, default=3306, help="MySQL port")
+parser.add_argument("--user", default="root", help="MySQL user")
+parser.add_argument("--password", "-p", help="MySQL password (omit to prompt)")
+parser.add_argument("--mongo-uri", default="mongodb://localhost:27017/", help="MongoDB URI")
+parser.add_argument("--schema", default="sfpl", help="Database/schema name")
+parser.add_argument("--json", help="Also write the results to this JSON file")
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    mix = {}
+    for item in args.mix.split(","):
+        name, _, weight = item.partition("=")
+        if name.strip() not in OPERATIONS:
+            parser.error(f"unknown operation in --mix: {name}")
+        if float(weight or 0) > 0:
+            mix[name.strip()] = float(weight)
+    if not mix:
+        parser.error("--mix needs at least one operation with a positive weight")
+
+    if args.backend == "mysql":
+        if not args.password:
+            args.password = getpass.getpass(f"Password for {args.user}@{args.host}: ")
+        wl = MySQLWorkload(args)
+    else:
+        wl = MongoWorkload(args)
+
+    stats = Stats()
+    inserted, inserted_lock = [], threading.Lock()
+    start = time.time()
+    deadline = start + args.duration
+    threads = [
+        threading.Thread(target=user_loop, args=(wl, stats, mix, deadline, args.seed * 1000 + i, inserted, inserted_lock))
+        for i in range(args.users)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.time() - start
+
+    # Remove what the run inserted and did not delete
+    for patron_id in inserted:
+        try:
+            wl.delete(random, patron_id)
+        except Exception as e:
+            print(f"cleanup failed for Patron_ID {patron_id}: {e}", file=sys.stderr)
+
+    summary = report(stats, elapsed, wl.backend, args.users)
+    summary["mix"] = mix
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        print(f"\nResults written to {args.json}")